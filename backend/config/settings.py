@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,14 +52,28 @@ AUTH_USER_MODEL = 'streakApp.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        # JSONRenderer's output, encoded by orjson when it is installed
+        'streakApp.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        # Second, so unauthenticated requests still get a 403 without WWW-Authenticate
+        'streakApp.authentication.SignedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Bearer tokens issued at Google login, checked without a session or user lookup
+API_TOKEN_AUTH = os.getenv('API_TOKEN_AUTH', 'false').lower() == 'true'
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(hours=int(os.getenv('API_TOKEN_LIFETIME_HOURS', '24'))),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -66,12 +84,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'streakApp.instrumentation.RequestTimingMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True  # Required for session-based auth
 
 # Session configuration for OAuth
+# cached_db (with REDIS_URL) or signed_cookies take the session query off authenticated requests
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
 SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
@@ -111,6 +132,11 @@ CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_HTTPONLY = False
 
 
+# Serve the busiest streak and completion endpoints from async views, for ASGI
+# deployments (gunicorn with uvicorn workers, see docker-compose.yml)
+ASYNC_API = os.getenv('ASYNC_API', 'false').lower() == 'true'
+
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -125,6 +151,100 @@ DATABASES = {
     }
 }
 
+# How workers hold their connections (DB_CONNECTIONS):
+#   persistent   one per worker thread, reused for DB_CONN_MAX_AGE seconds and checked
+#                after errors; the default for WSGI
+#   pool         a psycopg 3 pool of up to DB_POOL_MAX_SIZE per worker process; the
+#                default for ASGI, where every request in flight needs its own connection
+#   per-request  connect and disconnect around every request
+try:
+    import psycopg_pool
+except ImportError:  # psycopg2, or psycopg 3 without the pool extra
+    psycopg_pool = None
+
+DB_CONNECTIONS = os.getenv('DB_CONNECTIONS') or (
+    ('pool' if psycopg_pool else 'per-request') if ASYNC_API else 'persistent'
+)
+if DB_CONNECTIONS != 'per-request':
+    # Reused connections are tested before use, so a restarted server costs no failed request
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_CONNECTIONS == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+elif DB_CONNECTIONS == 'pool':
+    if psycopg_pool is None:
+        raise ImproperlyConfigured('DB_CONNECTIONS=pool needs psycopg 3 with the pool extra installed.')
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # Seconds a request waits for a free connection before failing
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+elif DB_CONNECTIONS != 'per-request':
+    raise ImproperlyConfigured(f'Unknown DB_CONNECTIONS {DB_CONNECTIONS!r}, use persistent, pool or per-request.')
+
+
+# Cache
+# Shared Redis cache in production, per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a serialized streak dashboard stays cached; writes invalidate it sooner
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+
+# Days of completion history nested in streak responses when no window is requested
+COMPLETION_WINDOW_DAYS = int(os.getenv('COMPLETION_WINDOW_DAYS', '365'))
+
+
+# Google OAuth client, login is disabled without it
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
+# Google OAuth endpoints; point them at a local fake to test or benchmark logins offline
+GOOGLE_TOKEN_URI = os.getenv('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+# API root for the userinfo fallback, when the token response has no ID token
+GOOGLE_API_ENDPOINT = os.getenv('GOOGLE_API_ENDPOINT')
+
+
+# Logging
+# JSON lines on stdout; LOG_LEVEL=DEBUG also logs every stats update
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'streakApp.instrumentation.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'streakApp': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Share of requests whose timings are logged, from 0 (none) to 1 (all). None by default under
+# manage.py test, so the output does not change from run to run; RequestLoggingTests set it themselves.
+TESTING = sys.argv[1:2] == ['test']
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv('REQUEST_LOG_SAMPLE_RATE', '0' if TESTING else '0.01'))
+
+# Query count and timings of every response in a Server-Timing header, shown by browser dev tools
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
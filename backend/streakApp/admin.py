@@ -2,7 +2,13 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import Streak, Completion, User
 
+
+class CompletionAdmin(admin.ModelAdmin):
+    # Completion.__str__ shows the streak name
+    list_select_related = ['streak']
+
+
 # Register your models here.
 admin.site.register(Streak)
-admin.site.register(Completion)
+admin.site.register(Completion, CompletionAdmin)
 admin.site.register(User, UserAdmin)
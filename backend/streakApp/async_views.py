@@ -0,0 +1,148 @@
+"""
+Async variants of the busiest streak and completion endpoints.
+
+With ASYNC_API enabled (see urls.py) these answer the same URLs as the DRF
+viewsets and return the same bodies, so an ASGI server does not hand every
+request to its single thread for sync code. Other methods on those URLs fall
+through to the viewsets.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import cache as dashboard_cache
+from . import fast_serializers
+from .authentication import SignedTokenAuthentication
+from .models import Completion
+from .serializers import CompletionSerializer
+from .views import StreakViewSet, CompletionViewSet
+
+_streak_list = StreakViewSet.as_view({'get': 'list', 'post': 'create'})
+# As the router builds it, so OPTIONS describes the action and other methods get the same 405
+_my_streaks = StreakViewSet.as_view(
+    {'get': 'my_streaks'}, basename='streak', detail=False, **StreakViewSet.my_streaks.kwargs
+)
+_completion_list = CompletionViewSet.as_view({'get': 'list', 'post': 'create'})
+_completion_detail = CompletionViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+})
+
+
+_renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+
+
+def _render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=status_code, content_type=_renderer.media_type)
+
+
+def _render_error(exc, status_code=None):
+    # Same body as rest_framework.views.exception_handler()
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return _render(data, status_code or exc.status_code)
+
+
+async def _authenticate(request):
+    """User of `request`, checked like the sync views: session with CSRF, then bearer token."""
+    user = await request.auser()
+    if user.is_authenticated:
+        SessionAuthentication().enforce_csrf(request)
+        return user
+    # Signature check only, nothing to await
+    token = SignedTokenAuthentication().authenticate(Request(request))
+    return token[0] if token else user
+
+
+async def _dashboard(request, scope, user=None):
+    view = StreakViewSet(action='list', format_kwarg=None, args=(), kwargs={})
+    view.request = Request(request)
+    queryset = view.filter_queryset(view.get_queryset())
+    if user is not None:
+        queryset = queryset.filter(user_id=user.id)
+
+    async def build():
+        # Same steps as StreakViewSet._build_dashboard(); my_streaks is never paginated
+        rows = fast_serializers.streak_values(queryset)
+        page = None if user is not None else view.paginator.page_queryset(rows, view.request)
+        if page is None:
+            streaks = [row async for row in rows]
+        else:
+            streaks = view.paginator.page_rows([row async for row in page])
+        completions = view.completion_rows(streaks)
+        if completions is not None:
+            completions = [row async for row in completions]
+        data = view.dashboard_data(streaks, completions)
+        return data if page is None else view.paginator.get_paginated_data(data)
+
+    key = await dashboard_cache.apayload_key(scope, view.dashboard_variant())
+    etag = dashboard_cache.etag(key, _renderer.format)
+    response = view.not_modified(etag)
+    if response is None:
+        data, hit = await dashboard_cache.aget_or_build(key, build)
+        response = _render(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return view.tag(response, etag)
+
+
+@csrf_exempt
+async def streak_list(request):
+    """GET /streaks/, async StreakViewSet.list()."""
+    if request.method != 'GET':
+        return await sync_to_async(_streak_list)(request)
+    try:
+        return await _dashboard(request, dashboard_cache.ALL_STREAKS)
+    except exceptions.APIException as exc:
+        return _render_error(exc)
+
+
+@csrf_exempt
+async def my_streaks(request):
+    """GET and HEAD /streaks/my_streaks/, async StreakViewSet.my_streaks()."""
+    # Django views answer HEAD with their GET handler, and the server drops the body
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(_my_streaks)(request)
+    try:
+        user = await _authenticate(request)
+        if not user.is_authenticated:
+            # SessionAuthentication has no WWW-Authenticate header, so DRF answers 403
+            return _render_error(exceptions.NotAuthenticated(), status.HTTP_403_FORBIDDEN)
+        return await _dashboard(request, user.id, user)
+    except exceptions.APIException as exc:
+        return _render_error(exc)
+
+
+@csrf_exempt
+async def completion_list(request):
+    """POST /completions/, async CompletionViewSet.create()."""
+    if request.method != 'POST':
+        return await sync_to_async(_completion_list)(request)
+    try:
+        await _authenticate(request)
+        data = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+        serializer = CompletionSerializer(data=data)
+        # Validation looks up the streak and checks the unique day
+        if not await sync_to_async(serializer.is_valid)():
+            return _render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        completion = await Completion.objects.acreate(**serializer.validated_data)
+    except exceptions.APIException as exc:
+        return _render_error(exc)
+    return _render(CompletionSerializer(completion).data, status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+async def completion_detail(request, pk):
+    """DELETE /completions/{id}/, async CompletionViewSet.destroy()."""
+    if request.method != 'DELETE':
+        return await sync_to_async(_completion_detail)(request, pk=pk)
+    try:
+        await _authenticate(request)
+        completion = await Completion.objects.aget(pk=pk)
+    except exceptions.APIException as exc:
+        return _render_error(exc)
+    except Completion.DoesNotExist:
+        return _render_error(exceptions.NotFound('No Completion matches the given query.'))
+    await completion.adelete()
+    return HttpResponse(status=status.HTTP_204_NO_CONTENT)
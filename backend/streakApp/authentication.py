@@ -0,0 +1,29 @@
+"""
+Optional bearer tokens, handed out by google_callback next to the session login.
+
+A token is trusted by its signature alone, so requests carrying one skip the
+session and user lookups. request.user is then a TokenUser that only knows its
+id. Tokens cannot be revoked before they expire; logging out only ends the
+session.
+"""
+from django.conf import settings
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTStatelessUserScheme
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class SignedTokenAuthentication(JWTStatelessUserAuthentication):
+    """`Authorization: Bearer <token>` without a database round trip, when API_TOKEN_AUTH is on."""
+
+    def authenticate(self, request):
+        if not settings.API_TOKEN_AUTH:
+            return None
+        return super().authenticate(request)
+
+
+class SignedTokenScheme(SimpleJWTStatelessUserScheme):
+    target_class = 'streakApp.authentication.SignedTokenAuthentication'
+
+
+def issue_token(user):
+    return str(AccessToken.for_user(user))
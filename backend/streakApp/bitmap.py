@@ -0,0 +1,63 @@
+"""
+Compact encoding of completion days as a base64 bitset.
+
+Bit i (least significant bit first within each byte) is set when the day
+origin + i was completed.
+"""
+import base64
+from datetime import date, timedelta
+
+
+def _run(start, length):
+    if not length:
+        return None
+    return {'start': start, 'end': start + timedelta(days=length - 1)}
+
+
+def encode_days(days, origin, today=None):
+    """Encode an iterable of dates on or after `origin`."""
+    offsets = sorted({(day - origin).days for day in days})
+    length = offsets[-1] + 1 if offsets else 0
+    bits = bytearray((length + 7) // 8)
+    for offset in offsets:
+        bits[offset >> 3] |= 1 << (offset & 7)
+
+    # Runs inside the encoded range; the current run ends today, or yesterday if today is still open
+    longest_start, longest_length = None, 0
+    run_start, run_length = None, 0
+    for offset in offsets:
+        if run_length and offset == run_start + run_length:
+            run_length += 1
+        else:
+            run_start, run_length = offset, 1
+        if run_length > longest_length:
+            longest_start, longest_length = run_start, run_length
+
+    completed = set(offsets)
+    anchor = ((today or date.today()) - origin).days
+    if anchor not in completed:
+        anchor -= 1
+    current_length = 0
+    while anchor - current_length in completed:
+        current_length += 1
+
+    return {
+        'origin': origin,
+        'length': length,
+        'bits': base64.b64encode(bytes(bits)).decode('ascii'),
+        'current_run': _run(origin + timedelta(days=anchor - current_length + 1), current_length),
+        'longest_run': _run(origin + timedelta(days=longest_start or 0), longest_length),
+    }
+
+
+def decode_days(encoded):
+    """Inverse of encode_days(), returning the sorted list of completed dates."""
+    origin = encoded['origin']
+    if isinstance(origin, str):
+        origin = date.fromisoformat(origin)
+    bits = base64.b64decode(encoded['bits'])
+    return [
+        origin + timedelta(days=offset)
+        for offset in range(encoded['length'])
+        if bits[offset >> 3] & (1 << (offset & 7))
+    ]
@@ -0,0 +1,102 @@
+"""
+Versioned cache for serialized streak dashboards.
+
+Each scope (a user id, or ALL_STREAKS for the unfiltered list) has a version
+number. Cached payloads are keyed by that version, so invalidating a scope only
+drops its version key and stale entries simply expire.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+ALL_STREAKS = 'all'
+
+# Per-process counters, reset on restart
+stats = {'hits': 0, 'misses': 0}
+
+
+def _version_key(scope):
+    return f'dashboard:version:{scope}'
+
+
+def _fresh_version():
+    # Never reuse a number after the counter is evicted, or old payloads would come back
+    return time.time_ns()
+
+
+def get_version(scope):
+    return cache.get_or_set(_version_key(scope), _fresh_version, timeout=None)
+
+
+async def aget_version(scope):
+    return await cache.aget_or_set(_version_key(scope), _fresh_version, timeout=None)
+
+
+def _bump(scopes):
+    # The next get_version() starts a fresh one; a single round trip for any number of scopes
+    cache.delete_many([_version_key(scope) for scope in scopes])
+
+
+def invalidate(*user_ids):
+    """Drop the cached dashboards of `user_ids` once the current transaction commits."""
+    if not user_ids:
+        return
+    scopes = (*user_ids, ALL_STREAKS)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _payload_key(scope, version, variant):
+    digest = hashlib.md5(variant.encode()).hexdigest()
+    return f'dashboard:{scope}:{version}:{digest}'
+
+
+def payload_key(scope, variant):
+    """
+    Cache key of the `variant` payload of `scope` at the scope's current version.
+
+    `variant` distinguishes different renderings of the same scope, e.g. the
+    request's query string.
+    """
+    return _payload_key(scope, get_version(scope), variant)
+
+
+async def apayload_key(scope, variant):
+    """Async payload_key()."""
+    return _payload_key(scope, await aget_version(scope), variant)
+
+
+def etag(key, renderer_format):
+    """
+    Strong ETag of the response rendered as `renderer_format` from the payload under `key`.
+
+    The key holds the scope version, so the tag changes with every invalidate()
+    and can be checked without reading or rendering the payload.
+    """
+    return '"%s"' % hashlib.md5(f'{key}:{renderer_format}'.encode()).hexdigest()
+
+
+def get_or_build(key, build):
+    """Return `(payload, hit)` for a payload_key(), calling `build` on a miss."""
+    data = cache.get(key)
+    if data is not None:
+        stats['hits'] += 1
+        return data, True
+    stats['misses'] += 1
+    data = build()
+    cache.set(key, data, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return data, False
+
+
+async def aget_or_build(key, build):
+    """Async get_or_build(), awaiting `build()` on a miss."""
+    data = await cache.aget(key)
+    if data is not None:
+        stats['hits'] += 1
+        return data, True
+    stats['misses'] += 1
+    data = await build()
+    await cache.aset(key, data, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return data, False
@@ -0,0 +1,115 @@
+"""
+Read-only fast path for the streak dashboards.
+
+StreakSerializer builds a model instance and calls to_representation() on
+every field of every nested completion. For dashboards with thousands of
+completions that dominates the request, so the list views read plain
+values() rows instead and assemble the dicts here, with the same keys, order
+and values as the DRF serializers. The field list and formats are taken from
+those serializers, so the two stay in step; tests compare the rendered bytes.
+"""
+import functools
+from datetime import date
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .serializers import StreakSerializer, StreakBitmapSerializer, CompletionSerializer, completion_bitmap
+
+# Fields whose representation is the database value itself
+_AS_STORED = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+    serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+)
+
+
+@functools.cache
+def _plan(serializer_class):
+    """`[(name, column, convert)]` for the fields of `serializer_class`; column is None for nested fields."""
+    model = serializer_class.Meta.model
+    plan = []
+    for name, field in serializer_class().fields.items():
+        if isinstance(field, (serializers.ListSerializer, serializers.SerializerMethodField)):
+            plan.append((name, None, None))
+            continue
+        column = model._meta.get_field(field.source).attname
+        if isinstance(field, serializers.DateField):
+            iso = getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601
+            convert = date.isoformat if iso else field.to_representation
+        elif type(field) in _AS_STORED:
+            convert = None
+        else:
+            convert = field.to_representation
+        plan.append((name, column, convert))
+    return plan
+
+
+def _columns(serializer_class):
+    return [column for _, column, _ in _plan(serializer_class) if column]
+
+
+def streak_values(queryset):
+    """values() rows of `queryset` with the columns streak_data() reads."""
+    return queryset.prefetch_related(None).values(*_columns(StreakSerializer))
+
+
+def completion_values(completions, streak_ids):
+    """values_list() rows of the `completions` of `streak_ids`, in the order they are nested."""
+    return (
+        completions.filter(streak_id__in=streak_ids)
+        .order_by('streak_id', 'date_completed')
+        .values_list(*_columns(CompletionSerializer))
+    )
+
+
+def _completion_dicts(rows):
+    """Completion dicts grouped by streak id, in one pass over the completion_values() rows."""
+    plan = _plan(CompletionSerializer)
+    names = [name for name, _, _ in plan]
+    # Only the dates need converting, the rest is copied as is
+    converted = [(index, convert) for index, (_, _, convert) in enumerate(plan) if convert is not None]
+    streak_index = _columns(CompletionSerializer).index('streak_id')
+    by_streak = {}
+    for row in rows:
+        values = list(row)
+        for index, convert in converted:
+            values[index] = convert(values[index])
+        by_streak.setdefault(row[streak_index], []).append(dict(zip(names, values)))
+    return by_streak
+
+
+def streak_data(streaks, completions, encoding='full', since=None, fields=None):
+    """
+    StreakSerializer(many=True).data, or StreakBitmapSerializer's for encoding='bitmap', from plain rows.
+
+    `streaks` are streak_values() rows and `completions` the completion_values()
+    rows for them, or None when the nested completions are not requested.
+    `fields` limits the top level keys like ?fields= does.
+    """
+    plan = _plan(StreakBitmapSerializer if encoding == 'bitmap' else StreakSerializer)
+    if fields is not None:
+        plan = [entry for entry in plan if entry[0] in fields]
+    if completions is not None:
+        if encoding == 'bitmap':
+            days = {}
+            date_index = _columns(CompletionSerializer).index('date_completed')
+            streak_index = _columns(CompletionSerializer).index('streak_id')
+            for row in completions:
+                days.setdefault(row[streak_index], []).append(row[date_index])
+        else:
+            nested = _completion_dicts(completions)
+
+    data = []
+    for row in streaks:
+        item = {}
+        for name, column, convert in plan:
+            if column is None:
+                if encoding == 'bitmap':
+                    item[name] = completion_bitmap(row['start_date'], days.get(row['id'], []), since)
+                else:
+                    item[name] = nested.get(row['id'], [])
+                continue
+            value = row[column]
+            item[name] = value if convert is None or value is None else convert(value)
+        data.append(item)
+    return data
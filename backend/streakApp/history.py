@@ -0,0 +1,190 @@
+"""
+A user's streaks and completions as a CSV or NDJSON file, streamed both ways.
+
+export() reads the rows through server-side cursors and yields the file
+CHUNK_SIZE lines at a time. load() takes the records the parsers read off
+the request body as it arrives and inserts them CHUNK_SIZE at a time. Neither
+holds more than a chunk of the history in memory, however long it is.
+
+Both formats have one record per line, the streaks first and then their
+completions, ordered by streak and date. `streak` is the id of the streak in
+the account it was exported from; load() maps it to the streak it imports to.
+"""
+import csv
+import io
+import json
+from datetime import date
+from itertools import chain, islice
+
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import ParseError, ValidationError
+
+from . import cache as dashboard_cache
+from .models import Streak, Completion
+from .serializers import StreakSerializer
+
+# Columns of the CSV file, and the keys of the NDJSON objects
+FIELDS = ('type', 'streak', 'name', 'color', 'description', 'start_date', 'is_active', 'date_completed')
+STREAK_FIELDS = ('name', 'color', 'description', 'start_date', 'is_active')
+# Rows per cursor fetch, per yielded chunk and per INSERT
+CHUNK_SIZE = 2000
+
+
+def _chunks(rows):
+    rows = iter(rows)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield chunk
+
+
+def _csv_chunks(streaks, completions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    rows = chain(
+        (
+            ('streak', streak_id, name, color, description, start_date, 'true' if is_active else 'false', None)
+            for streak_id, name, color, description, start_date, is_active in streaks
+        ),
+        (('completion', streak_id, None, None, None, None, None, day) for streak_id, day in completions),
+    )
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Only the header, the user has no streaks
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(streaks, completions):
+    lines = chain(
+        (
+            json.dumps(
+                {'type': 'streak', 'streak': streak_id, 'name': name, 'color': color, 'description': description,
+                 'start_date': start_date.isoformat(), 'is_active': is_active},
+                separators=(',', ':'),
+            )
+            for streak_id, name, color, description, start_date, is_active in streaks
+        ),
+        # A number and an ISO date, nothing to escape
+        (f'{{"type":"completion","streak":{streak_id},"date_completed":"{day}"}}' for streak_id, day in completions),
+    )
+    for chunk in _chunks(lines):
+        yield ('\n'.join(chunk) + '\n').encode()
+
+
+ENCODERS = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks}
+
+
+def export(user, format):
+    """The history of `user` as a `format` ('csv' or 'ndjson') file, in byte chunks."""
+    # Only the id, request.user is a TokenUser with API_TOKEN_AUTH
+    streaks = (
+        Streak.objects.filter(user_id=user.id).order_by('id')
+        .values_list('id', 'name', 'color', 'description', 'start_date', 'is_active')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    completions = (
+        Completion.objects.filter(streak__user_id=user.id).order_by('streak_id', 'date_completed')
+        .values_list('streak_id', 'date_completed')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return ENCODERS[format](streaks, completions)
+
+
+async def aiter_chunks(chunks):
+    """
+    `chunks` as an async iterator, each one read in the request's sync thread.
+
+    Under ASGI, StreamingHttpResponse reads a sync iterator to the end before
+    it sends anything. The cursors live on that thread's connection.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def read_csv(lines):
+    """(line number, record) pairs of a CSV file, given as an iterable of text lines."""
+    reader = csv.DictReader(lines)
+    try:
+        if 'type' not in (reader.fieldnames or ()):
+            raise ParseError('Line 1: expected the header row, with a type column.')
+        for row in reader:
+            # Empty cells are missing values, extra cells are under None
+            yield reader.line_num, {name: value for name, value in row.items() if name and value}
+    except csv.Error as exc:
+        raise ParseError(f'Line {reader.line_num}: {exc}')
+
+
+def read_ndjson(lines):
+    """(line number, record) pairs of an NDJSON file, given as an iterable of text lines."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ParseError(f'Line {number}: {exc}')
+        if not isinstance(record, dict):
+            raise ParseError(f'Line {number}: expected a JSON object.')
+        yield number, record
+
+
+def load(user, records):
+    """
+    Import the (line number, record) pairs of read_csv() or read_ndjson() into `user`.
+
+    A streak with the color of one of the user's streaks is that streak, so an
+    export loaded back into the same account only adds what is missing. Other
+    streaks are created, and fail like the streak API on a color another user
+    has. Days already completed are skipped. The stats are recomputed once at
+    the end. Run it in a transaction, so a bad line leaves nothing behind.
+    Returns the number of streaks created and of completions added.
+    """
+    existing = dict(Streak.objects.filter(user_id=user.id).values_list('color', 'id'))
+    completions_before = Completion.objects.filter(streak__user_id=user.id).count()
+    # Streak ids in the file: ids in the database
+    streak_ids = {}
+    streaks_created = 0
+    batch = []
+    for line, record in records:
+        kind = record.get('type')
+        if kind == 'streak':
+            if record.get('color') in existing:
+                streak_ids[str(record.get('streak'))] = existing[record['color']]
+                continue
+            serializer = StreakSerializer(data={name: record[name] for name in STREAK_FIELDS if name in record})
+            if not serializer.is_valid():
+                raise ValidationError({'line': line, **serializer.errors})
+            streak = serializer.save(user_id=user.id)
+            streak_ids[str(record.get('streak'))] = existing[streak.color] = streak.id
+            streaks_created += 1
+        elif kind == 'completion':
+            streak_id = streak_ids.get(str(record.get('streak')))
+            if streak_id is None:
+                raise ValidationError({'line': line, 'streak': ['No streak with this id earlier in the file.']})
+            try:
+                day = date.fromisoformat(record.get('date_completed'))
+            except (TypeError, ValueError):
+                raise ValidationError({'line': line, 'date_completed': ['Expected a YYYY-MM-DD date.']})
+            # bulk_create skips Completion.save(), which fills in day_of_week
+            batch.append(Completion(streak_id=streak_id, date_completed=day, day_of_week=day.weekday()))
+            if len(batch) == CHUNK_SIZE:
+                Completion.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        else:
+            raise ValidationError({'line': line, 'type': ['Expected "streak" or "completion".']})
+    Completion.objects.bulk_create(batch, ignore_conflicts=True)
+
+    Streak.objects.filter(id__in=set(streak_ids.values())).recompute_stats()
+    # The nested completions changed even where the stats did not
+    dashboard_cache.invalidate(user.id)
+    return {
+        'streaks_created': streaks_created,
+        'completions_added': Completion.objects.filter(streak__user_id=user.id).count() - completions_before,
+    }
@@ -0,0 +1,174 @@
+"""
+Structured logging and per-request timing.
+
+Every request collects its database queries and the time spent in named
+sections (serializer, render, signals, recalculate_stats). They are sent back
+in a Server-Timing header and added to the in-process metrics served by the
+metrics endpoint. A sampled share of requests is also logged as a single
+`request` record, written as one JSON object per line.
+"""
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """Queries and section timings of one request, in milliseconds."""
+    __slots__ = ('queries', 'db_ms', 'sections')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.sections = {}
+
+
+# RequestStats of the current request, None outside of one. sync_to_async copies
+# the context, so ORM calls of the async views add to the same object.
+_stats = ContextVar('request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_ms += (time.perf_counter() - start) * 1000
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Fired again on every reconnect of the same connection object
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def percentile(sorted_values, fraction):
+    """Value below which `fraction` of the ascending `sorted_values` fall, 0.0 for no values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record and the fields passed through `extra` as a JSON object."""
+    # Attributes of every LogRecord; anything else was passed through `extra`
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update((key, value) for key, value in vars(record).items() if key not in self._reserved)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class timed:
+    """Add the time spent in the block to `section` of the current request."""
+    # A plain class rather than @contextmanager, it is entered on every completion write
+    __slots__ = ('section', 'stats', 'start')
+
+    def __init__(self, section):
+        self.section = section
+
+    def __enter__(self):
+        self.stats = _stats.get()
+        if self.stats is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            elapsed = (time.perf_counter() - self.start) * 1000
+            sections = self.stats.sections
+            sections[self.section] = sections.get(self.section, 0.0) + elapsed
+
+
+# Method labels of the metrics and the request log, any other method is 'other'
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+def server_timing(duration_ms, stats):
+    """Server-Timing header value for a request that took `duration_ms`."""
+    entries = [f'total;dur={duration_ms:.2f}', f'db;dur={stats.db_ms:.2f};desc="{stats.queries} queries"']
+    entries.extend(f'{section};dur={ms:.2f}' for section, ms in stats.sections.items())
+    return ', '.join(entries)
+
+
+class RequestTimingMiddleware:
+    """
+    Time every request for the Server-Timing header and the metrics endpoint.
+
+    A REQUEST_LOG_SAMPLE_RATE share of requests is also logged. Works on both
+    the WSGI and ASGI handlers without a thread switch.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def finish(self, request, response, stats, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(duration_ms, stats)
+        # Named routes and known methods only, so clients cannot add labels without end
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        metrics.requests.observe(view, method, response.status_code, duration_ms / 1000, stats)
+
+        if random.random() < settings.REQUEST_LOG_SAMPLE_RATE and logger.isEnabledFor(logging.INFO):
+            logger.info('request', extra={
+                'method': method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 3),
+                'queries': stats.queries,
+                'db_ms': round(stats.db_ms, 3),
+                'timings_ms': {section: round(ms, 3) for section, ms in stats.sections.items()},
+            })
+        return response
@@ -0,0 +1,69 @@
+"""
+Rankings and counts across all users.
+
+The top current streaks are read live. The completion signals keep
+Streak.current_streak up to date, and streak_top_current_idx hands out the
+longest ones in order without looking at the rest of the table. Weekly
+activity and the site totals would each have to count every completion, so
+they come from two materialized views instead. refresh() recounts those,
+every five minutes in production (the refresh_leaderboard command).
+"""
+from datetime import date, timedelta
+
+from django.db import connection
+
+from .models import Streak, User, WeeklyActivity, LeaderboardTotals
+
+# Refreshed in this order, the totals read the weekly activity
+VIEWS = (WeeklyActivity, LeaderboardTotals)
+
+
+def week_start(day=None):
+    """Monday of the week of `day`, today by default."""
+    day = day or date.today()
+    return day - timedelta(days=day.weekday())
+
+
+def top_streaks(limit):
+    """The `limit` active streaks with the longest current run, with rank and username."""
+    rows = list(
+        Streak.objects.filter(is_active=True, current_streak__gt=0)
+        .order_by('-current_streak', 'id')
+        .values_list('id', 'user_id', 'current_streak')[:limit]
+    )
+    usernames = dict(User.objects.filter(id__in={user_id for _, user_id, _ in rows}).values_list('id', 'username'))
+    return [
+        {'rank': rank, 'streak': streak_id, 'user': user_id, 'username': usernames.get(user_id, ''),
+         'current_streak': current_streak}
+        for rank, (streak_id, user_id, current_streak) in enumerate(rows, 1)
+    ]
+
+
+def most_active(limit):
+    """The `limit` users with the most completions this week, as of the last refresh."""
+    rows = (
+        WeeklyActivity.objects.filter(week=week_start())
+        .order_by('-completions', 'user_id')
+        .values_list('user_id', 'username', 'completions')[:limit]
+    )
+    return [
+        {'rank': rank, 'user': user_id, 'username': username, 'completions': completions}
+        for rank, (user_id, username, completions) in enumerate(rows, 1)
+    ]
+
+
+def totals():
+    return LeaderboardTotals.objects.get()
+
+
+def refresh():
+    """Recount the materialized views. Readers see the previous counts until it is done."""
+    with connection.cursor() as cursor:
+        for view in VIEWS:
+            table = connection.ops.quote_name(view._meta.db_table)
+            cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {table}')
+        # Marks the pages all-visible, so the top-N reads stay index-only scans. VACUUM
+        # cannot run in a transaction, which only the tests wrap this in.
+        if not connection.in_atomic_block:
+            for view in VIEWS:
+                cursor.execute(f'VACUUM (ANALYZE) {connection.ops.quote_name(view._meta.db_table)}')
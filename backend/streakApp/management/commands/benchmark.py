@@ -0,0 +1,299 @@
+import json
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+
+from streakApp.instrumentation import percentile
+from streakApp.models import Streak, User
+
+SCENARIOS = ('dashboard', 'toggle', 'login')
+GUNICORN_START_TIMEOUT = 30
+# Query count RequestTimingMiddleware puts in the Server-Timing header
+SERVER_TIMING_QUERIES = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+
+def log_in(user):
+    """Session cookie value for `user`, from the same login() google_callback ends with."""
+    client = Client()
+    client.force_login(user)
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+class ClientTarget:
+    """Requests through the Django test client in this process, counting their queries."""
+    name = 'client'
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def run(self, step, index):
+        """Run `step` and return `(status, queries)`."""
+        queries = 0
+
+        def count(execute, *args):
+            nonlocal queries
+            queries += 1
+            return execute(*args)
+
+        with connection.execute_wrapper(count):
+            status = step(self, index)
+        return status, queries
+
+    def send(self, method, path, session):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        client = self.local.client
+        client.cookies[settings.SESSION_COOKIE_NAME] = session
+        return client.generic(method, path).status_code
+
+
+class HttpTarget:
+    """Requests to a running server over keep-alive HTTP/1.1 connections, one per thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError('Only http:// URLs are supported.')
+        self.name = url
+        self.address = (parts.hostname, parts.port or 80)
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()
+        # The server accepts any token that matches its cookie
+        request = HttpRequest()
+        self.csrf_token = get_token(request)
+        self.csrf_cookie = request.META['CSRF_COOKIE']
+
+    def run(self, step, index):
+        # Counted by the server, None when it sends no Server-Timing header
+        self.local.queries = None
+        status = step(self, index)
+        return status, self.local.queries
+
+    def send(self, method, path, session):
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = HTTPConnection(*self.address, timeout=60)
+        headers = {
+            'Cookie': (
+                f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={self.csrf_cookie}'
+            ),
+            'X-CSRFToken': self.csrf_token,
+        }
+        # Reconnects by itself after a `Connection: close` response
+        self.local.connection.request(method, self.prefix + path, headers=headers)
+        response = self.local.connection.getresponse()
+        response.read()
+        match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing', ''))
+        self.local.queries = int(match[1]) if match else None
+        return response.status
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the dashboard, toggle and login scenarios as users made by seed_streaks and report '
+        'throughput, latency percentiles and queries per request. Runs in process through the test '
+        'client unless --url or --gunicorn is given. Save the results with --output and compare '
+        'two runs with --baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Repeatable, default all.')
+        parser.add_argument('--requests', type=int, default=500, help='Timed requests per scenario (default 500).')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests first (default 20).')
+        parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight (default 1).')
+        parser.add_argument('--users', type=int, default=50, help='Seeded users taking turns (default 50).')
+        parser.add_argument('--prefix', default='seed', help='Username prefix given to seed_streaks.')
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--url', help='Running server, e.g. http://127.0.0.1:8000')
+        target.add_argument('--gunicorn', action='store_true', help='Start a local gunicorn for the run.')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default 2).')
+        parser.add_argument('--asgi', action='store_true', help='Run gunicorn with uvicorn workers.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='JSON file of an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        self.users = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')[:options['users']])
+        if not self.users:
+            raise CommandError(f'No users starting with "{options["prefix"]}", run seed_streaks first.')
+        self.streaks = list(Streak.objects.filter(user__in=self.users).order_by('id'))
+        scenarios = options['scenario'] or SCENARIOS
+        if 'toggle' in scenarios and not self.streaks:
+            raise CommandError('The seeded users have no streaks to toggle.')
+        self.sessions = {user.id: log_in(user) for user in self.users}
+        self.toggled = Counter()
+        self.lock = threading.Lock()
+
+        server = None
+        if options['gunicorn']:
+            server, url = self.start_gunicorn(options['workers'], options['asgi'])
+            target = HttpTarget(url)
+        elif options['url']:
+            target = HttpTarget(options['url'])
+        else:
+            target = ClientTarget()
+        try:
+            results = {
+                'commit': self.commit(),
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'target': ('gunicorn-asgi' if options['asgi'] else 'gunicorn') if server else target.name,
+                'users': len(self.users),
+                'scenarios': {},
+            }
+            for name in scenarios:
+                step = getattr(self, name)
+                self.measure(target, step, 0, options['warmup'], options['concurrency'])
+                sessions = self.sessions_started()
+                results['scenarios'][name] = result = self.measure(
+                    target, step, options['warmup'], options['requests'], options['concurrency']
+                )
+                result['connections_opened'] = None if sessions is None else self.sessions_started() - sessions
+                self.stdout.write(self.summary(name, results['scenarios'][name]))
+            self.restore(target)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self.compare(json.load(f), results)
+
+    def dashboard(self, target, index):
+        user = self.users[index % len(self.users)]
+        return target.send('GET', '/api/streaks/my_streaks/', self.sessions[user.id])
+
+    def toggle(self, target, index):
+        streak = self.streaks[index % len(self.streaks)]
+        status = target.send('POST', f'/api/streaks/{streak.id}/toggle/', self.sessions[streak.user_id])
+        if status == 200:
+            with self.lock:
+                self.toggled[streak] += 1
+        return status
+
+    def login(self, target, index):
+        # What google_callback does once Google has answered, then the first request of the session
+        user = self.users[index % len(self.users)]
+        return target.send('GET', '/api/users/me/', log_in(user))
+
+    def restore(self, target):
+        """Toggle today back on the streaks that were toggled an odd number of times."""
+        for streak, count in self.toggled.items():
+            if count % 2:
+                target.send('POST', f'/api/streaks/{streak.id}/toggle/', self.sessions[streak.user_id])
+
+    def measure(self, target, step, first, count, concurrency):
+        indexes = iter(range(first, first + count))
+        latencies, queries, statuses = [], [], Counter()
+
+        def worker():
+            for index in indexes:
+                start = time.perf_counter()
+                status, query_count = target.run(step, index)
+                latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(query_count)
+                statuses[str(status)] += 1
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            # On this thread's database connection, like the rest of the command
+            worker()
+        else:
+            with ThreadPoolExecutor(concurrency) as pool:
+                for future in [pool.submit(worker) for _ in range(concurrency)]:
+                    future.result()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        counted = [query_count for query_count in queries if query_count is not None]
+        return {
+            'requests': len(latencies),
+            'concurrency': concurrency,
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1] if latencies else 0.0, 2),
+            'queries_per_request': round(sum(counted) / len(counted), 2) if counted else None,
+            'statuses': dict(statuses),
+        }
+
+    def sessions_started(self):
+        """Connections PostgreSQL has accepted for this database so far, None on other databases."""
+        if connection.vendor != 'postgresql' or connection.pg_version < 140000:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT sessions FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+    def summary(self, name, result):
+        queries, opened = result['queries_per_request'], result['connections_opened']
+        return (
+            f'{name:>10}: {result["requests_per_second"]:8.1f} req/s  p50 {result["p50_ms"]:7.2f}  '
+            f'p95 {result["p95_ms"]:7.2f}  p99 {result["p99_ms"]:7.2f} ms  '
+            f'{"-" if queries is None else queries} queries/request  '
+            f'{"-" if opened is None else opened} connections opened  {result["statuses"]}'
+        )
+
+    def compare(self, baseline, results):
+        self.stdout.write(f'\nCompared with {baseline.get("commit") or "baseline"} ({baseline.get("target")}):')
+        for name, result in results['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(name)
+            if before is None:
+                continue
+            changes = []
+            keys = ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'connections_opened')
+            for key in keys:
+                old, new = before.get(key), result[key]
+                if old is None or new is None:
+                    continue
+                change = f' ({(new - old) / old:+.0%})' if old else ''
+                changes.append(f'{key} {old} -> {new}{change}')
+            self.stdout.write(f'{name:>10}: ' + ', '.join(changes))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def start_gunicorn(self, workers, asgi=False):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        app = ['config.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'] if asgi else ['config.wsgi:application']
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *app,
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR,
+        )
+        deadline = time.monotonic() + GUNICORN_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited with status {server.returncode}.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'gunicorn did not start within {GUNICORN_START_TIMEOUT}s.')
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from streakApp.instrumentation import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Send concurrent HTTP/1.1 requests to a running server for a fixed time and '
+        'report requests/sec and latency percentiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://127.0.0.1:8000/api/streaks/my_streaks/')
+        parser.add_argument('--concurrency', type=int, default=64, help='Open connections (default 64).')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default 10).')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--body', default='', help='Request body, sent as JSON.')
+        parser.add_argument(
+            '--header', action='append', default=[], metavar='NAME:VALUE',
+            help='Extra header, e.g. "Cookie: sessionid=...". Repeatable.',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as one JSON object.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported.')
+        path = url.path + (f'?{url.query}' if url.query else '')
+        body = options['body'].encode()
+        headers = [f'Host: {url.netloc}', 'Connection: keep-alive', *options['header']]
+        if body:
+            headers += ['Content-Type: application/json', f'Content-Length: {len(body)}']
+        head = '\r\n'.join([f'{options["method"]} {path} HTTP/1.1', *headers])
+        self.request = f'{head}\r\n\r\n'.encode() + body
+        self.address = (url.hostname, url.port or 80)
+
+        latencies, statuses = [], {}
+        started = time.perf_counter()
+        asyncio.run(self.run(options['concurrency'], started + options['duration'], latencies, statuses))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        results = {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'requests': len(latencies),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1] if latencies else 0.0, 2),
+            'statuses': statuses,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            for key, value in results.items():
+                self.stdout.write(f'{key:>20}: {value}')
+
+    async def run(self, concurrency, deadline, latencies, statuses):
+        await asyncio.gather(*(self.worker(deadline, latencies, statuses) for _ in range(concurrency)))
+
+    async def worker(self, deadline, latencies, statuses):
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if writer is None:
+                reader, writer = await asyncio.open_connection(*self.address)
+            writer.write(self.request)
+            status, keep_alive = await self.read_response(reader)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not keep_alive:
+                # Sync gunicorn workers close the connection after every response
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    async def read_response(self, reader):
+        status = int((await reader.readline()).split()[1])
+        length, keep_alive = None, True
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value == 'close':
+                keep_alive = False
+        if length is None:
+            await reader.read()
+            keep_alive = False
+        else:
+            await reader.readexactly(length)
+        return status, keep_alive
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from streakApp.models import Streak
+
+
+class Command(BaseCommand):
+    help = 'Recalculate current_streak, longest_streak and days_completed from completions in one SQL pass.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='Only streaks of this user id (repeatable).')
+        parser.add_argument('--streak', type=int, action='append', help='Only this streak id (repeatable).')
+
+    def handle(self, *args, **options):
+        streaks = Streak.objects.all()
+        if options['user']:
+            streaks = streaks.filter(user_id__in=options['user'])
+        if options['streak']:
+            streaks = streaks.filter(id__in=options['streak'])
+        updated = streaks.recompute_stats()
+        self.stdout.write(self.style.SUCCESS(f'Updated stats of {updated} streak(s)'))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from streakApp import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recount the weekly activity and site totals behind the leaderboard. Run every few minutes.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        leaderboard.refresh()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the leaderboard in {elapsed:.1f}s'))
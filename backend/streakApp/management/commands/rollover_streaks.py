@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from streakApp.models import Streak
+
+
+class Command(BaseCommand):
+    help = 'Reset current_streak of streaks that were not completed yesterday. Run shortly after midnight.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Streak ids per UPDATE statement.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed = Streak.objects.all().roll_over(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Rolled over {changed} streak(s) in {elapsed:.1f}s'))
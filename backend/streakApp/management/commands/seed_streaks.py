@@ -0,0 +1,75 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from streakApp import cache as dashboard_cache
+from streakApp.models import Streak, Completion, User, Color
+
+
+class Command(BaseCommand):
+    help = (
+        'Create USERS users with STREAKS streaks each and YEARS years of random completions, '
+        'for benchmarks. The users have no password and log in only through the benchmark command.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--streaks', type=int, default=5, help='Streaks per user (default 5).')
+        parser.add_argument('--years', type=float, default=2, help='Years of completions per streak (default 2).')
+        parser.add_argument(
+            '--density', type=float, default=0.6, help='Share of days that are completed (default 0.6).'
+        )
+        parser.add_argument('--prefix', default='seed', help='Username prefix (default "seed").')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per INSERT statement.')
+        parser.add_argument('--random-seed', type=int, default=0, help='Same seed, same completions.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f'Users starting with "{prefix}" already exist, pick another --prefix.')
+        started = time.monotonic()
+        rng = random.Random(options['random_seed'])
+        batch_size = options['batch_size']
+        today = date.today()
+        start_date = today - timedelta(days=round(options['years'] * 365))
+        days = [start_date + timedelta(days=offset) for offset in range((today - start_date).days + 1)]
+
+        users = []
+        for index in range(options['users']):
+            user = User(username=f'{prefix}{index}')
+            user.set_unusable_password()
+            users.append(user)
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+
+        # color is unique across all streaks, so past the palette it gets a suffix
+        streaks = [
+            Streak(
+                user=user, name=f'Habit {number + 1}', start_date=start_date,
+                color=f'{Color.values[number % len(Color.values)]}-{user.username}-{number}',
+            )
+            for user in users for number in range(options['streaks'])
+        ]
+        streaks = Streak.objects.bulk_create(streaks, batch_size=batch_size)
+
+        completed = 0
+        batch = []
+        for streak in streaks:
+            for day in days:
+                if rng.random() < options['density']:
+                    # bulk_create skips Completion.save(), which fills in day_of_week
+                    batch.append(Completion(streak=streak, date_completed=day, day_of_week=day.weekday()))
+            if len(batch) >= batch_size:
+                Completion.objects.bulk_create(batch, batch_size=batch_size)
+                completed += len(batch)
+                batch = []
+        Completion.objects.bulk_create(batch, batch_size=batch_size)
+        completed += len(batch)
+
+        Streak.objects.filter(user__in=User.objects.filter(username__startswith=prefix)).recompute_stats()
+        dashboard_cache.invalidate(*(user.id for user in users))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} user(s), {len(streaks)} streak(s) and {completed} completion(s) in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,121 @@
+"""
+Request metrics kept in process memory, exported in the Prometheus text format.
+
+RequestTimingMiddleware feeds every request in: its duration and query count
+as histograms, and its database and section time as counters, per view and
+method. The values add up from process start, as Prometheus expects; rate()
+and histogram_quantile() over any window give the recent picture. Each worker
+process counts on its own, so a scrape reports the worker that answered it.
+"""
+import threading
+from bisect import bisect_left
+
+# Seconds, Prometheus' default buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket plus +Inf, not yet cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class ViewMetrics:
+    __slots__ = ('duration', 'queries', 'db_seconds', 'section_seconds', 'statuses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.section_seconds = {}
+        self.statuses = {}
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, method, status, seconds, stats):
+        """Count one request to `view` that took `seconds`, with the RequestStats `stats`."""
+        with self.lock:
+            metrics = self.views.get((view, method))
+            if metrics is None:
+                metrics = self.views[(view, method)] = ViewMetrics()
+            metrics.duration.observe(seconds)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_ms / 1000
+            for section, ms in stats.sections.items():
+                metrics.section_seconds[section] = metrics.section_seconds.get(section, 0.0) + ms / 1000
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format 0.0.4."""
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+            self._histogram(lines, views, 'duration', 'streakapp_request_duration_seconds',
+                            'Time from the middleware receiving the request to the response.')
+            self._histogram(lines, views, 'queries', 'streakapp_request_queries',
+                            'Database queries per request.')
+            self._counter(lines, 'streakapp_requests_total', 'Responses by status code.', (
+                (_labels(view=view, method=method, status=status), count)
+                for (view, method), metrics in views for status, count in sorted(metrics.statuses.items())
+            ))
+            self._counter(lines, 'streakapp_db_duration_seconds_total', 'Time spent running queries.', (
+                (_labels(view=view, method=method), metrics.db_seconds) for (view, method), metrics in views
+            ))
+            self._counter(
+                lines, 'streakapp_section_duration_seconds_total',
+                'Time spent in named sections such as serializer, render and signals.', (
+                    (_labels(view=view, method=method, section=section), seconds)
+                    for (view, method), metrics in views
+                    for section, seconds in sorted(metrics.section_seconds.items())
+                ),
+            )
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, lines, views, attribute, name, help_text):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), metrics in views:
+            histogram = getattr(metrics, attribute)
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(view=view, method=method, le=le)} {cumulative}')
+            labels = _labels(view=view, method=method)
+            lines.append(f'{name}_sum{labels} {_number(histogram.sum)}')
+            lines.append(f'{name}_count{labels} {cumulative}')
+
+    def _counter(self, lines, name, help_text, samples):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines.extend(f'{name}{labels} {_number(value)}' for labels, value in samples)
+
+
+requests = RequestMetrics()
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 15:19
+
+from django.db import migrations
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def deduplicate_completions(apps, schema_editor):
+    """Keep the oldest completion for each streak and day, ahead of the unique constraint."""
+    Completion = apps.get_model('streakApp', 'Completion')
+    duplicate_ids = list(
+        Completion.objects.annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F('streak_id'), F('date_completed')],
+                order_by=F('id').asc(),
+            )
+        )
+        .filter(rank__gt=1)
+        .values_list('id', flat=True)
+    )
+    # Duplicates never counted towards the stats, so they stay as they are
+    for start in range(0, len(duplicate_ids), 10000):
+        Completion.objects.filter(id__in=duplicate_ids[start:start + 10000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streakApp', '0003_streak_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_completions, migrations.RunPython.noop),
+    ]
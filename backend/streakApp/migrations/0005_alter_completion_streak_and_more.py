@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 15:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streakApp', '0004_deduplicate_completions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='streak',
+            index=models.Index(fields=['user', 'is_active'], name='streak_user_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='completion',
+            constraint=models.UniqueConstraint(fields=('streak', 'date_completed'), name='unique_completion_per_day'),
+        ),
+        # Drop the single-column index only once the constraint covers it
+        migrations.AlterField(
+            model_name='completion',
+            name='streak',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='streakApp.streak'),
+        ),
+    ]
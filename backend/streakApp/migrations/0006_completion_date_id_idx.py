@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streakApp', '0005_alter_completion_streak_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(fields=['date_completed', 'id'], name='completion_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models.functions import ExtractIsoWeekDay
+
+
+def backfill_day_of_week(apps, schema_editor):
+    """Fix day_of_week on rows written without Completion.save(), now that aggregates group by it."""
+    Completion = apps.get_model('streakApp', 'Completion')
+    # ISO weekdays run from 1 (Monday), date.weekday() from 0
+    weekday = ExtractIsoWeekDay('date_completed') - 1
+    Completion.objects.exclude(day_of_week=weekday).update(day_of_week=weekday)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streakApp', '0006_completion_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_day_of_week, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.1 on 2026-10-18 16:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Monday of the current week, without going through a time zone
+WEEK_START = "CURRENT_DATE - (EXTRACT(ISODOW FROM CURRENT_DATE)::integer - 1)"
+
+CREATE_WEEKLY_ACTIVITY = f'''
+CREATE MATERIALIZED VIEW "streakApp_weeklyactivity" AS
+SELECT s.user_id, u.username, {WEEK_START} AS week, count(*)::integer AS completions
+FROM "streakApp_completion" c
+JOIN "streakApp_streak" s ON s.id = c.streak_id
+JOIN auth_user u ON u.id = s.user_id
+WHERE c.date_completed >= {WEEK_START} AND c.date_completed < {WEEK_START} + 7
+GROUP BY s.user_id, u.username;
+
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX weeklyactivity_user_idx ON "streakApp_weeklyactivity" (user_id);
+CREATE INDEX weeklyactivity_top_idx ON "streakApp_weeklyactivity" (completions DESC, user_id) INCLUDE (username, week);
+'''
+
+CREATE_LEADERBOARD_TOTALS = f'''
+CREATE MATERIALIZED VIEW "streakApp_leaderboardtotals" AS
+SELECT
+    1 AS id,
+    (SELECT count(*) FROM "streakApp_completion") AS completions,
+    (SELECT coalesce(sum(completions), 0) FROM "streakApp_weeklyactivity")::bigint AS completions_this_week,
+    (SELECT count(*) FROM "streakApp_completion" WHERE date_completed = CURRENT_DATE) AS completions_today,
+    (SELECT count(*) FROM "streakApp_streak") AS streaks,
+    (SELECT count(*) FROM "streakApp_streak" WHERE is_active) AS active_streaks,
+    (SELECT count(*) FROM auth_user) AS users,
+    (SELECT count(*) FROM "streakApp_weeklyactivity") AS active_users_this_week,
+    now() AS refreshed_at;
+
+CREATE UNIQUE INDEX leaderboardtotals_id_idx ON "streakApp_leaderboardtotals" (id);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streakApp', '0007_backfill_day_of_week'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completions', models.BigIntegerField()),
+                ('completions_this_week', models.BigIntegerField()),
+                ('completions_today', models.BigIntegerField()),
+                ('streaks', models.BigIntegerField()),
+                ('active_streaks', models.BigIntegerField()),
+                ('users', models.BigIntegerField()),
+                ('active_users_this_week', models.BigIntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'streakApp_leaderboardtotals',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyActivity',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username', models.CharField(max_length=150)),
+                ('week', models.DateField()),
+                ('completions', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'streakApp_weeklyactivity',
+                'managed': False,
+            },
+        ),
+        # The totals read the weekly view, so they are created after it and dropped first
+        migrations.RunSQL(CREATE_WEEKLY_ACTIVITY, 'DROP MATERIALIZED VIEW "streakApp_weeklyactivity"'),
+        migrations.RunSQL(CREATE_LEADERBOARD_TOTALS, 'DROP MATERIALIZED VIEW "streakApp_leaderboardtotals"'),
+        migrations.AddIndex(
+            model_name='streak',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-current_streak', 'id'], include=('user',), name='streak_top_current_idx'),
+        ),
+    ]
@@ -1,6 +1,44 @@
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q, Exists, OuterRef, Count
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.contrib.auth.models import AbstractUser
 from datetime import date, timedelta
+import itertools
+import random
+
+from . import cache as dashboard_cache
+from .instrumentation import timed
+
+ONE_DAY = timedelta(days=1)
+
+
+def _step(day, delta):
+    """`day + delta`, or None past the ends of the calendar."""
+    try:
+        return day + delta
+    except OverflowError:
+        return None
+
+
+def _clamped(day, delta):
+    """`day + delta`, or date.min or date.max past the ends of the calendar."""
+    return _step(day, delta) or (date.max if delta > timedelta(0) else date.min)
+
+
+def _run_length(dates, day, step):
+    """Count consecutive days present in `dates`, starting at `day` and moving by `step`."""
+    length = 0
+    while day in dates:
+        length += 1
+        day = _step(day, step)
+    return length
+
+
+def _current_run(dates, today):
+    """Length of the run ending today, or yesterday if today is not completed yet."""
+    anchor = today if today in dates else today - ONE_DAY
+    return _run_length(dates, anchor, -ONE_DAY)
 
 
 class User(AbstractUser):
@@ -16,6 +54,44 @@ class User(AbstractUser):
         db_table = 'auth_user'
 
 
+USERNAME_ATTEMPTS = 10
+
+
+def _free_usernames(base_username, taken):
+    """`base_username`, then `base_username_1`, `base_username_2`... skipping those in `taken`."""
+    if base_username not in taken:
+        yield base_username
+    for counter in itertools.count(1):
+        username = f'{base_username}_{counter}'
+        if username not in taken:
+            yield username
+
+
+def create_user_with_free_username(base_username, **fields):
+    """
+    Create a User named `base_username`, or `base_username_<n>` with the lowest free n.
+
+    The names already taken are read in one query. If a concurrent signup
+    claims the chosen name first, the insert is rolled back to a savepoint and
+    retried with a fresh read.
+    """
+    for attempt in range(USERNAME_ATTEMPTS):
+        taken = set(
+            User.objects.filter(Q(username=base_username) | Q(username__startswith=f'{base_username}_'))
+            .values_list('username', flat=True)
+        )
+        # After a lost race, pick among more free names so parallel signups stop colliding
+        username = random.choice(list(itertools.islice(_free_usernames(base_username, taken), 2 ** attempt)))
+        try:
+            with transaction.atomic():
+                return User.objects.create(username=username, **fields)
+        except IntegrityError:
+            # Only a lost race for the name is worth another attempt
+            if not User.objects.filter(username=username).exists():
+                raise
+    raise IntegrityError(f'No free username for {base_username!r} after {USERNAME_ATTEMPTS} attempts')
+
+
 class Color(models.TextChoices):
     RED = 'red'
     ORANGE = 'orange'
@@ -40,6 +116,132 @@ class Color(models.TextChoices):
     NEUTRAL = 'neutral'
     STONE = 'stone'
 
+# Gaps and islands: consecutive dates minus their row number share one value per run
+RECOMPUTE_STATS_SQL = '''
+WITH anchor AS (
+    SELECT %s::date AS today
+),
+islands AS (
+    SELECT streak_id, date_completed,
+           date_completed - (ROW_NUMBER() OVER (PARTITION BY streak_id ORDER BY date_completed))::integer AS island
+    FROM {completion}
+    WHERE streak_id IN ({streak_ids})
+),
+runs AS (
+    SELECT streak_id, COUNT(*) AS length, MIN(date_completed) AS first_day, MAX(date_completed) AS last_day
+    FROM islands
+    GROUP BY streak_id, island
+),
+stats AS (
+    SELECT streak_id,
+           SUM(length)::integer AS days_completed,
+           MAX(length)::integer AS longest_streak,
+           MAX(CASE
+               WHEN today BETWEEN first_day AND last_day THEN today - first_day + 1
+               WHEN today - 1 BETWEEN first_day AND last_day THEN today - first_day
+               ELSE 0
+           END) AS current_streak
+    FROM runs CROSS JOIN anchor
+    GROUP BY streak_id
+),
+targets AS (
+    SELECT target.id,
+           COALESCE(stats.current_streak, 0) AS current_streak,
+           COALESCE(stats.longest_streak, 0) AS longest_streak,
+           COALESCE(stats.days_completed, 0) AS days_completed
+    FROM {streak} AS target
+    LEFT JOIN stats ON stats.streak_id = target.id
+    WHERE target.id IN ({streak_ids})
+)
+UPDATE {streak} AS streak
+SET current_streak = targets.current_streak,
+    longest_streak = targets.longest_streak,
+    days_completed = targets.days_completed
+FROM targets
+WHERE streak.id = targets.id
+  AND (streak.current_streak, streak.longest_streak, streak.days_completed)
+      IS DISTINCT FROM (targets.current_streak, targets.longest_streak, targets.days_completed)
+RETURNING streak.user_id
+'''
+
+# Writes one completion and, in the same round trip, reads the dates the incremental
+# stats update needs. The SELECT sees the table as it was before the write.
+TOGGLE_COMPLETION_SQL = '''
+WITH deleted AS (
+    DELETE FROM {completion}
+    WHERE %(delete)s AND streak_id = %(streak)s AND date_completed = %(day)s
+    RETURNING 1
+),
+inserted AS (
+    INSERT INTO {completion} (streak_id, date_completed, day_of_week)
+    SELECT %(streak)s, %(day)s, %(day_of_week)s
+    WHERE %(insert)s AND NOT EXISTS (SELECT 1 FROM deleted)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+SELECT
+    EXISTS (SELECT 1 FROM deleted),
+    EXISTS (SELECT 1 FROM inserted),
+    ARRAY(
+        SELECT date_completed FROM {completion}
+        WHERE streak_id = %(streak)s
+          AND (date_completed BETWEEN %(near_start)s AND %(near_end)s
+               OR date_completed BETWEEN %(recent_start)s AND %(today)s)
+    )
+'''
+
+
+class StreakQuerySet(models.QuerySet):
+    def recompute_stats(self):
+        """
+        Recalculate the stats of every streak in this queryset with one SQL statement.
+
+        Same results as Streak.recalculate_stats(), but the runs are found in
+        PostgreSQL. Only rows whose stats change are written; returns their count.
+        """
+        try:
+            streak_ids, params = self.values('id').query.sql_with_params()
+        except EmptyResultSet:
+            # none(), or a filter like id__in=[] that can match nothing
+            return 0
+        sql = RECOMPUTE_STATS_SQL.format(
+            completion=connection.ops.quote_name(Completion._meta.db_table),
+            streak=connection.ops.quote_name(Streak._meta.db_table),
+            streak_ids=streak_ids,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [date.today(), *params, *params])
+            updated = cursor.fetchall()
+        # A bulk UPDATE sends no post_save, so drop the cached dashboards here
+        dashboard_cache.invalidate(*{user_id for user_id, in updated})
+        return len(updated)
+
+    def roll_over(self, batch_size=10000):
+        """
+        Bring current_streak up to date after the date changed, without any writes.
+
+        Streaks with nothing completed since yesterday drop to zero, one bulk UPDATE
+        per `batch_size` of them. Streaks with a completion entered ahead for today
+        are recomputed. Returns the number of streaks changed.
+        """
+        today = date.today()
+        recent = Completion.objects.filter(streak=OuterRef('pk'), date_completed__gte=today - ONE_DAY)
+        broken = self.filter(current_streak__gt=0).exclude(Exists(recent))
+        # Keyset batches of the broken streaks themselves, so gaps in the ids cost nothing
+        pending = broken.order_by('id').values_list('id', 'user_id')
+
+        changed = 0
+        rows = list(pending[:batch_size])
+        while rows:
+            # The condition again, in case a completion arrived since the read
+            changed += broken.filter(id__in=[streak_id for streak_id, _ in rows]).update(current_streak=0)
+            dashboard_cache.invalidate(*{user_id for _, user_id in rows})
+            rows = list(pending.filter(id__gt=rows[-1][0])[:batch_size])
+
+        changed += self.filter(completion__date_completed=today).recompute_stats()
+        return changed
+
+
 class Streak(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, default=1)
     name = models.CharField(max_length=255)
@@ -51,59 +253,264 @@ class Streak(models.Model):
     longest_streak = models.IntegerField(default=0)
     days_completed = models.IntegerField(default=0)
 
+    objects = StreakQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_active'], name='streak_user_active_idx'),
+            # Top current streaks straight from the index, see leaderboard.top_streaks()
+            models.Index(
+                fields=['-current_streak', 'id'], include=['user'], condition=models.Q(is_active=True),
+                name='streak_top_current_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The owner as loaded, so moving the streak can drop the previous owner's dashboards
+        instance._loaded_user_id = instance.__dict__.get('user_id')
+        return instance
+
     def recalculate_stats(self):
         """Recalculate current_streak, longest_streak, and days_completed from completions."""
-        completions = self.completion_set.order_by('-date_completed')
-        completed_dates = set(c.date_completed for c in completions)
+        with timed('recalculate_stats'):
+            # Dates only, so PostgreSQL can answer from the (streak, date_completed) index
+            completed_dates = set(self.completion_set.values_list('date_completed', flat=True))
         
-        # Total days completed
-        self.days_completed = len(completed_dates)
+            # Total days completed
+            self.days_completed = len(completed_dates)
         
-        # Calculate current streak (consecutive days from today backwards)
-        current_streak = 0
-        check_date = date.today()
+            # Calculate current streak (consecutive days from today backwards)
+            current_streak = 0
+            check_date = date.today()
         
-        # Allow for today not being completed yet - check if yesterday was completed
-        if check_date not in completed_dates:
-            check_date = check_date - timedelta(days=1)
+            # Allow for today not being completed yet - check if yesterday was completed
+            if check_date not in completed_dates:
+                check_date = check_date - timedelta(days=1)
         
-        while check_date in completed_dates:
-            current_streak += 1
-            check_date = check_date - timedelta(days=1)
+            while check_date in completed_dates:
+                current_streak += 1
+                check_date = check_date - timedelta(days=1)
         
-        self.current_streak = current_streak
+            self.current_streak = current_streak
         
-        # Calculate longest streak
-        if not completed_dates:
-            self.longest_streak = 0
-        else:
-            sorted_dates = sorted(completed_dates)
-            longest = 1
-            current = 1
+            # Calculate longest streak
+            if not completed_dates:
+                self.longest_streak = 0
+            else:
+                sorted_dates = sorted(completed_dates)
+                longest = 1
+                current = 1
             
-            for i in range(1, len(sorted_dates)):
-                if sorted_dates[i] - sorted_dates[i-1] == timedelta(days=1):
-                    current += 1
-                    longest = max(longest, current)
-                else:
-                    current = 1
+                for i in range(1, len(sorted_dates)):
+                    if sorted_dates[i] - sorted_dates[i-1] == timedelta(days=1):
+                        current += 1
+                        longest = max(longest, current)
+                    else:
+                        current = 1
             
-            self.longest_streak = longest
+                self.longest_streak = longest
         
+            self.save(update_fields=['current_streak', 'longest_streak', 'days_completed'])
+
+    def completion_aggregates(self, today=None):
+        """
+        Completions per weekday (Monday first), per month and per week, and the completion rate.
+
+        Each grouping is one GROUP BY in the database. The rate counts the days
+        completed from start_date through today, over the days in that range.
+        """
+        today = today or date.today()
+        completions = self.completion_set.all()
+        weekdays = [0] * 7
+        completed_since_start = 0
+        by_weekday = completions.values('day_of_week').annotate(
+            count=Count('id'),
+            since_start=Count('id', filter=Q(date_completed__range=(self.start_date, today))),
+        )
+        for row in by_weekday:
+            weekdays[row['day_of_week']] = row['count']
+            completed_since_start += row['since_start']
+        days_since_start = max((today - self.start_date).days + 1, 0)
+        return {
+            'weekdays': weekdays,
+            'months': list(
+                completions.annotate(start=TruncMonth('date_completed'))
+                .values('start').annotate(count=Count('id')).order_by('start')
+            ),
+            'weeks': list(
+                completions.annotate(start=TruncWeek('date_completed'))
+                .values('start').annotate(count=Count('id')).order_by('start')
+            ),
+            'days_since_start': days_since_start,
+            'completed_since_start': completed_since_start,
+            'completion_rate': completed_since_start / days_since_start if days_since_start else None,
+        }
+
+    def _dates_within(self, *ranges):
+        """Fetch the set of completion dates that fall in any of the given ranges."""
+        query = Q()
+        for start, end in ranges:
+            query |= Q(date_completed__range=(start, end))
+        return set(self.completion_set.filter(query).values_list('date_completed', flat=True))
+
+    def toggle_completion(self, day, completed=None):
+        """
+        Complete `day` (completed=True), un-complete it (False) or flip it (None).
+
+        The completion is written with raw SQL, so no Completion signals fire; the
+        stats are updated incrementally here instead, and saving them drops the
+        cached dashboards. Lock the streak row first, e.g. with select_for_update(),
+        so concurrent toggles apply one after another. Returns whether `day` ends
+        up completed.
+        """
+        today = date.today()
+        span = timedelta(days=self.longest_streak + 1)
+        sql = TOGGLE_COMPLETION_SQL.format(completion=connection.ops.quote_name(Completion._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'streak': self.pk,
+                'day': day,
+                'day_of_week': day.weekday(),
+                'delete': completed is not True,
+                'insert': completed is not False,
+                # Enough for either update, see record_completion_added()
+                'near_start': _clamped(day, -span),
+                'near_end': _clamped(day, span),
+                'recent_start': _clamped(today, -2 * span),
+                'today': today,
+            })
+            deleted, inserted, dates = cursor.fetchone()
+
+        dates = set(dates)
+        if inserted:
+            dates.add(day)
+            self.record_completion_added(day, dates)
+            return True
+        if deleted:
+            dates.discard(day)
+            self.record_completion_removed(day, dates)
+            return False
+        # Already in the requested state
+        return day in dates if completed is None else completed
+
+    def record_completion_added(self, day, dates=None):
+        """
+        Update stats after a completion for `day` was inserted.
+
+        Only the dates around `day` and around today are read. No run can be longer
+        than longest_streak, so that window is enough to find both neighbouring runs.
+        Callers that already hold those dates, including `day`, pass them as `dates`.
+        """
+        today = date.today()
+        reach = self.longest_streak + 1
+        span = timedelta(days=reach)
+        if dates is None:
+            dates = self._dates_within(
+                (_clamped(day, -span), _clamped(day, span)), (_clamped(today, -2 * span), today)
+            )
+        left = _run_length(dates, _step(day, -ONE_DAY), -ONE_DAY)
+        right = _run_length(dates, _step(day, ONE_DAY), ONE_DAY)
+        current_streak = _current_run(dates, today)
+        if max(left, right) >= reach or current_streak >= 2 * reach:
+            # Stored stats disagree with the completions, start over
+            self.recalculate_stats()
+            return
+
+        self.days_completed += 1
+        self.longest_streak = max(self.longest_streak, left + 1 + right)
+        self.current_streak = current_streak
+        self.save(update_fields=['current_streak', 'longest_streak', 'days_completed'])
+
+    def record_completion_removed(self, day, dates=None):
+        """
+        Update stats after a completion for `day` was deleted.
+
+        Falls back to recalculate_stats() when the removed day belonged to a run as
+        long as longest_streak, since another run of that length may or may not exist.
+        `dates` works as in record_completion_added(), without `day`.
+        """
+        today = date.today()
+        reach = self.longest_streak + 1
+        span = timedelta(days=reach)
+        if dates is None:
+            dates = self._dates_within((_clamped(day, -span), _clamped(day, span)), (_clamped(today, -span), today))
+        left = _run_length(dates, _step(day, -ONE_DAY), -ONE_DAY)
+        right = _run_length(dates, _step(day, ONE_DAY), ONE_DAY)
+        current_streak = _current_run(dates, today)
+        if left + 1 + right >= self.longest_streak or current_streak >= reach:
+            self.recalculate_stats()
+            return
+
+        self.days_completed -= 1
+        self.current_streak = current_streak
         self.save(update_fields=['current_streak', 'longest_streak', 'days_completed'])
 
 
 class Completion(models.Model):
-    streak = models.ForeignKey(Streak, on_delete=models.CASCADE)
+    # Indexed through the unique (streak, date_completed) constraint below
+    streak = models.ForeignKey(Streak, on_delete=models.CASCADE, db_index=False)
     date_completed = models.DateField()
     day_of_week = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['streak', 'date_completed'], name='unique_completion_per_day'),
+        ]
+        indexes = [
+            # Keyset pages of the completion list, see pagination.CompletionPagination
+            models.Index(fields=['date_completed', 'id'], name='completion_date_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.streak.name} - {self.date_completed}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The streak as loaded, so moving the completion can update the one it leaves
+        instance._loaded_streak_id = instance.__dict__.get('streak_id')
+        return instance
+
     def save(self, *args, **kwargs):
         self.day_of_week = self.date_completed.weekday()  # 0 is Monday, 6 is Sunday
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class WeeklyActivity(models.Model):
+    """
+    Completions per user in the current week, which starts on Monday.
+
+    A materialized view refreshed by the refresh_leaderboard command, see
+    leaderboard.py. `week` tells which week the last refresh counted.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.DO_NOTHING, primary_key=True, db_constraint=False, related_name='+'
+    )
+    username = models.CharField(max_length=150)
+    week = models.DateField()
+    completions = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'streakApp_weeklyactivity'
+
+
+class LeaderboardTotals(models.Model):
+    """Site-wide counts in a single row, a materialized view refreshed with WeeklyActivity."""
+    completions = models.BigIntegerField()
+    completions_this_week = models.BigIntegerField()
+    completions_today = models.BigIntegerField()
+    streaks = models.BigIntegerField()
+    active_streaks = models.BigIntegerField()
+    users = models.BigIntegerField()
+    active_users_this_week = models.BigIntegerField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'streakApp_leaderboardtotals'
@@ -0,0 +1,154 @@
+"""
+Keyset pagination for the list endpoints.
+
+A page is read as `WHERE (ordering) > (last row) ORDER BY ordering LIMIT n`,
+which an index on the ordering columns answers without skipping over earlier
+rows. The cost of a page therefore does not depend on how deep it is or on the
+size of the table, unlike LIMIT/OFFSET. There is no total count, which would
+mean scanning the whole table.
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages in `ordering`, which must end in a unique column.
+
+    The `cursor` query parameter holds the ordering values of the last row of
+    the previous page, `page_size` chooses the page length.
+    """
+    ordering = ('id',)
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    # Paginate only requests that ask for it with a cursor or page_size
+    optional = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.page_rows(list(queryset))
+
+    def page_queryset(self, queryset, request):
+        """`queryset` limited to the requested page plus one row, or None when not paginating."""
+        params = request.query_params
+        if self.optional and self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        model = queryset.model
+        self.fields = [model._meta.get_field(name) for name in self.ordering]
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(model, self.decode_cursor(cursor)))
+        # One extra row tells whether there is a next page
+        return queryset.order_by(*self.ordering)[:self.page_size + 1]
+
+    def page_rows(self, rows):
+        """Trim the extra row fetched by page_queryset() and remember where the next page starts."""
+        self.next_row = rows[self.page_size - 1] if len(rows) > self.page_size else None
+        return rows[:self.page_size]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        # Model instances, or values() rows from the dashboard fast path
+        if isinstance(row, dict):
+            values = [row[field.attname] for field in self.fields]
+        else:
+            values = [field.value_from_object(row) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+    def after(self, model, values):
+        """Condition for rows past `values`, as one row comparison so it stays an index range."""
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ', '.join(f'{table}.{quote(field.column)}' for field in self.fields)
+        placeholders = ', '.join(['%s'] * len(values))
+        return RawSQL(f'({columns}) > ({placeholders})', values, output_field=BooleanField())
+
+    def get_next_link(self):
+        if self.next_row is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_row))
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {'next': self.get_next_link(), 'results': data}
+
+    def get_paginated_response_schema(self, schema):
+        if self.optional:
+            # Documented unpaginated, which is the default response
+            return schema
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value, taken from the next link.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page, at most {self.max_page_size}.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+        if self.optional:
+            for parameter in parameters:
+                parameter['description'] += ' Either one turns the response into a {next, results} page.'
+        return parameters
+
+
+class StreakPagination(KeysetPagination):
+    """Streaks by id. Opt-in, the dashboard reads the whole list as a plain array."""
+    optional = True
+
+
+class CompletionPagination(KeysetPagination):
+    """Completions by day, oldest first. Opt-in, so the list stays a plain array for existing clients."""
+    ordering = ('date_completed', 'id')
+    optional = True
@@ -0,0 +1,36 @@
+"""
+CSV and NDJSON request bodies, for the streak import.
+
+The parsers do not read the body up front. request.data is a generator of
+(line number, record) pairs that reads a line of the body at a time, see
+history.load().
+"""
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import history
+
+
+def _lines(stream, parser_context):
+    encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+    try:
+        yield from codecs.iterdecode(stream, encoding)
+    except UnicodeDecodeError as exc:
+        raise ParseError(f'Body is not valid {encoding}: {exc}')
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return history.read_csv(_lines(stream, parser_context))
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return history.read_ndjson(_lines(stream, parser_context))
@@ -0,0 +1,78 @@
+"""
+JSONRenderer with orjson doing the encoding, when it is installed.
+
+The output matches rest_framework.renderers.JSONRenderer with the default
+compact, unicode settings byte for byte, including the escaped U+2028/U+2029.
+Dates, times and anything orjson does not know are handed to DRF's encoder,
+so they come out the same as well. Only floats differ: large ones are written
+as 1e16 rather than 1e+16, and NaN becomes null instead of an error. Indented
+output (`Accept: application/json; indent=4`), non-default JSON settings and
+data orjson refuses, such as integers wider than 64 bits, use DRF's renderer.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:  # Optional, JSONRenderer's json module does the work without it
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in JSONRenderer, listed first in DEFAULT_RENDERER_CLASSES."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same as JSONRenderer, these two are valid JSON but not valid JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Prometheus text exposition format, for the metrics endpoint."""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode()
+        # Error responses, such as the 403 for users who are not staff
+        return JSONRenderer().render(data)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Content negotiation of the streak export, which streams its own body.
+
+    Only error responses are rendered, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
@@ -1,14 +1,39 @@
+from datetime import date
+
 from rest_framework import serializers
-from .models import Streak, Completion, User
+from drf_spectacular.utils import extend_schema_field
+from .bitmap import encode_days
+from .models import Streak, Completion, User, LeaderboardTotals
+
+
+def requested_fields(request):
+    """Field names from `?fields=a,b` on a GET request, or None to keep them all."""
+    if request is None or request.method != 'GET' or 'fields' not in request.query_params:
+        return None
+    return {name.strip() for name in request.query_params['fields'].split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """Serialize only the fields named in `?fields=`, at the top level of the response."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        root = self.root
+        # Nested serializers share the context, so leave them whole
+        if root is self or (self.parent is root and isinstance(root, serializers.ListSerializer)):
+            names = requested_fields(self.context.get('request'))
+            if names is not None:
+                fields = {name: field for name, field in fields.items() if name in names}
+        return fields
 
 
-class CompletionSerializer(serializers.ModelSerializer):
+class CompletionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Completion
         fields = '__all__'
 
 
-class StreakSerializer(serializers.ModelSerializer):
+class StreakSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     completions = CompletionSerializer(many=True, read_only=True, source='completion_set')
     # These are computed by signals and should be read-only
     current_streak = serializers.IntegerField(read_only=True)
@@ -20,6 +45,161 @@ class StreakSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class CompletionRunSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+
+
+class CompletionBitmapSerializer(serializers.Serializer):
+    """Completion days as a base64 bitset, see bitmap.encode_days()."""
+    origin = serializers.DateField(help_text='Date of bit 0.')
+    length = serializers.IntegerField(help_text='Number of days encoded.')
+    bits = serializers.CharField(help_text='Base64 bitset, least significant bit first within each byte.')
+    current_run = CompletionRunSerializer(allow_null=True)
+    longest_run = CompletionRunSerializer(allow_null=True, help_text='Longest run inside the encoded range.')
+
+
+class StreakBitmapSerializer(StreakSerializer):
+    """StreakSerializer with the nested completion objects replaced by a bitmap."""
+    completions = None
+    completion_bitmap = serializers.SerializerMethodField()
+
+    @extend_schema_field(CompletionBitmapSerializer)
+    def get_completion_bitmap(self, obj):
+        days = [completion.date_completed for completion in obj.completion_set.all()]
+        return completion_bitmap(obj.start_date, days, self.context.get('since'))
+
+
+def completion_bitmap(start_date, days, since=None):
+    """CompletionBitmapSerializer data for the completed `days` of a streak, cut off at `since`."""
+    # Bit 0 is the start date, unless older days were completed or cut off by the window
+    origin = min([start_date, *days])
+    if since:
+        origin = max(origin, since)
+    return CompletionBitmapSerializer(encode_days(days, origin)).data
+
+
+class CompletionWindowSerializer(serializers.Serializer):
+    """Query parameters choosing which completions are nested in streak responses, and how."""
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+    # A century, a window ending before date.min would overflow
+    days = serializers.IntegerField(required=False, min_value=1, max_value=36500)
+    encoding = serializers.ChoiceField(choices=['full', 'bitmap'], default='full')
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'days' in attrs:
+            raise serializers.ValidationError('Use either since or days, not both.')
+        if 'since' in attrs and 'until' in attrs and attrs['since'] > attrs['until']:
+            raise serializers.ValidationError('since must not be after until.')
+        return attrs
+
+
+class StreakStatsSerializer(serializers.ModelSerializer):
+    """The signal-maintained counters of a streak."""
+
+    class Meta:
+        model = Streak
+        fields = ['id', 'current_streak', 'longest_streak', 'days_completed']
+        read_only_fields = fields
+
+
+class CompletionCountSerializer(serializers.Serializer):
+    start = serializers.DateField(help_text='First day of the month, or Monday of the week.')
+    count = serializers.IntegerField()
+
+
+class StreakAggregatesSerializer(serializers.Serializer):
+    """Chart data of one streak, see Streak.completion_aggregates()."""
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(), min_length=7, max_length=7,
+        help_text='Completions per weekday, Monday first.',
+    )
+    months = CompletionCountSerializer(many=True, help_text='Months with completions, oldest first.')
+    weeks = CompletionCountSerializer(many=True, help_text='Weeks with completions, oldest first.')
+    days_since_start = serializers.IntegerField(help_text='Days from start_date through today.')
+    completed_since_start = serializers.IntegerField()
+    completion_rate = serializers.FloatField(
+        allow_null=True, help_text='completed_since_start / days_since_start, null before start_date.'
+    )
+
+
+class CompletionBulkItemSerializer(serializers.Serializer):
+    # Plain id so a large batch does not fetch its streak once per item
+    streak = serializers.IntegerField()
+    date_completed = serializers.DateField()
+
+
+class CompletionBulkSerializer(serializers.Serializer):
+    """Payload for creating or deleting many completions in one request."""
+    completions = CompletionBulkItemSerializer(many=True, allow_empty=False)
+
+    def validate_completions(self, items):
+        streak_ids = {item['streak'] for item in items}
+        found = set(Streak.objects.filter(id__in=streak_ids).values_list('id', flat=True))
+        missing = streak_ids - found
+        if missing:
+            raise serializers.ValidationError(f'Invalid streak ids: {sorted(missing)}')
+        return items
+
+
+class CompletionBulkResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField(required=False)
+    deleted = serializers.IntegerField(required=False)
+    streaks = StreakStatsSerializer(many=True)
+
+
+class CompletionToggleSerializer(serializers.Serializer):
+    """Query parameters of the toggle action."""
+    date = serializers.DateField(default=date.today)
+    # With a default, a missing parameter stays None instead of reading as False
+    completed = serializers.BooleanField(allow_null=True, default=None)
+
+
+class CompletionToggleResultSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    completed = serializers.BooleanField(help_text='Whether date is completed after the request.')
+    streak = StreakStatsSerializer()
+
+
+class StreakImportResultSerializer(serializers.Serializer):
+    streaks_created = serializers.IntegerField()
+    completions_added = serializers.IntegerField(help_text='Days already completed are not counted.')
+
+
+class LeaderboardParamsSerializer(serializers.Serializer):
+    """Query parameters of the leaderboard actions."""
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class LeaderboardStreakSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    streak = serializers.IntegerField()
+    user = serializers.IntegerField()
+    username = serializers.CharField()
+    current_streak = serializers.IntegerField()
+
+
+class LeaderboardUserSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    user = serializers.IntegerField()
+    username = serializers.CharField()
+    completions = serializers.IntegerField()
+
+
+class WeeklyLeaderboardSerializer(serializers.Serializer):
+    week = serializers.DateField(help_text='Monday of the current week.')
+    results = LeaderboardUserSerializer(many=True)
+
+
+class LeaderboardTotalsSerializer(serializers.ModelSerializer):
+    refreshed_at = serializers.DateTimeField(help_text='When the counts were taken.')
+
+    class Meta:
+        model = LeaderboardTotals
+        exclude = ['id']
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model with Google OAuth fields."""
     # Exclude sensitive token fields from serialization
@@ -39,13 +219,13 @@ class UserSerializer(serializers.ModelSerializer):
     def get_google_access_token(self, obj):
         # Only return token if user is viewing their own profile
         request = self.context.get('request')
-        if request and request.user == obj:
+        if request and request.user.id == obj.id:
             return obj.google_access_token
         return None
     
     def get_google_refresh_token(self, obj):
         # Only return token if user is viewing their own profile
         request = self.context.get('request')
-        if request and request.user == obj:
+        if request and request.user.id == obj.id:
             return obj.google_refresh_token
         return None
\ No newline at end of file
@@ -1,17 +1,104 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from weakref import WeakKeyDictionary
+
+from django.db.models import QuerySet
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Completion
+from . import cache as dashboard_cache
+from .instrumentation import timed
+from .models import Streak, Completion
+
+logger = logging.getLogger(__name__)
+
+_stats_updates_suspended = ContextVar('stats_updates_suspended', default=False)
+
+# Streaks already recalculated for each in-flight queryset delete
+_recalculated_by_delete = WeakKeyDictionary()
+
+
+@contextmanager
+def suspend_stats_updates():
+    """
+    Skip the per-completion stats updates inside the block.
+
+    Callers writing many completions at once are expected to call
+    Streak.recalculate_stats() on each affected streak afterwards.
+    """
+    token = _stats_updates_suspended.set(True)
+    try:
+        yield
+    finally:
+        _stats_updates_suspended.reset(token)
+
+
+def _fresh_streak(instance):
+    # The incremental update builds on the stored counters, so never trust a cached instance
+    return Streak.objects.get(pk=instance.streak_id)
+
 
 # Signals to update streak stats when completions change
 @receiver(post_save, sender=Completion)
-def update_streak_on_completion_save(sender, instance, **kwargs):
-    """Recalculate streak stats when a completion is added or updated."""
-    print(f"Updating streak stats for {instance.streak.name}")
-    instance.streak.recalculate_stats()
+def update_streak_on_completion_save(sender, instance, created, **kwargs):
+    """Update streak stats when a completion is added or updated."""
+    if _stats_updates_suspended.get():
+        return
+    with timed('signals'):
+        streak = _fresh_streak(instance)
+        if created:
+            streak.record_completion_added(instance.date_completed)
+        else:
+            # The previous date is unknown here, so rebuild from scratch
+            streak.recalculate_stats()
+            previous = getattr(instance, '_loaded_streak_id', None)
+            if previous not in (None, streak.pk):
+                # Moved from another streak, which is now a completion short
+                left = Streak.objects.get(pk=previous)
+                left.recalculate_stats()
+                dashboard_cache.invalidate(left.user_id)
+            instance._loaded_streak_id = streak.pk
+        dashboard_cache.invalidate(streak.user_id)
+    logger.debug('Updated streak stats', extra={'streak': streak.pk, 'completion': instance.pk})
 
 
 @receiver(post_delete, sender=Completion)
-def update_streak_on_completion_delete(sender, instance, **kwargs):
-    """Recalculate streak stats when a completion is deleted."""
-    print(f"Updating streak stats for {instance.streak.name}")
-    instance.streak.recalculate_stats()
+def update_streak_on_completion_delete(sender, instance, origin=None, **kwargs):
+    """Update streak stats when a completion is deleted."""
+    if _stats_updates_suspended.get():
+        return
+    if origin is instance:
+        with timed('signals'):
+            streak = _fresh_streak(instance)
+            streak.record_completion_removed(instance.date_completed)
+    elif isinstance(origin, QuerySet) and origin.model is Completion:
+        # Every row is gone before the first signal fires, so one rebuild per streak is enough
+        done = _recalculated_by_delete.setdefault(origin, set())
+        if instance.streak_id in done:
+            return
+        done.add(instance.streak_id)
+        with timed('signals'):
+            streak = _fresh_streak(instance)
+            streak.recalculate_stats()
+    else:
+        # Cascade from deleting the streak or its user, the stats go away with it
+        return
+    dashboard_cache.invalidate(streak.user_id)
+    logger.debug('Updated streak stats', extra={'streak': streak.pk, 'completion': instance.pk})
+
+
+# Signals to drop cached dashboards when a streak itself changes, including its stats
+@receiver(post_save, sender=Streak)
+def invalidate_dashboard_on_streak_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_user_id', None)
+    if previous not in (None, instance.user_id):
+        # Moved to another user, whose dashboards and the previous owner's both change
+        dashboard_cache.invalidate(previous, instance.user_id)
+    else:
+        dashboard_cache.invalidate(instance.user_id)
+    instance._loaded_user_id = instance.user_id
+
+
+@receiver(post_delete, sender=Streak)
+def invalidate_dashboard_on_streak_delete(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.user_id)
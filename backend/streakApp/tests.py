@@ -1,3 +1,1556 @@
-from django.test import TestCase
+import base64
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, timedelta
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from . import google_oauth
+from . import leaderboard
+from . import metrics
+from .authentication import issue_token
+from .bitmap import encode_days, decode_days
+from .instrumentation import JsonFormatter
+from .models import Streak, Completion, User, Color, ONE_DAY, create_user_with_free_username
+from .renderers import FastJSONRenderer
+from .urls import router, async_urlpatterns
+from .views import StreakViewSet
+from . import views
+
+# Sync viewsets under /api/, the async variants in front of them under /async/
+urlpatterns = [
+    path('api/metrics/', views.metrics, name='metrics'),
+    path('api/', include(router.urls)),
+    path('async/', include(async_urlpatterns + router.urls)),
+]
+
+
+class IncrementalStatsTests(TestCase):
+    """The incremental signal path must agree with Streak.recalculate_stats()."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='runner')
+        self.streak = Streak.objects.create(
+            user=self.user, name='Run', start_date=date.today() - timedelta(days=60), color='red'
+        )
+
+    def assert_matches_full_rebuild(self):
+        self.streak.refresh_from_db()
+        incremental = (self.streak.current_streak, self.streak.longest_streak, self.streak.days_completed)
+        self.streak.recalculate_stats()
+        full = (self.streak.current_streak, self.streak.longest_streak, self.streak.days_completed)
+        self.assertEqual(incremental, full)
+
+    def test_random_add_and_delete_sequences(self):
+        today = date.today()
+        for seed in range(5):
+            rng = random.Random(seed)
+            Completion.objects.filter(streak=self.streak).delete()
+            for _ in range(80):
+                day = today - timedelta(days=rng.randint(-2, 20))
+                existing = Completion.objects.filter(streak=self.streak, date_completed=day).first()
+                if existing:
+                    existing.delete()
+                else:
+                    Completion.objects.create(streak=self.streak, date_completed=day)
+                self.assert_matches_full_rebuild()
+
+    def test_bridging_two_runs(self):
+        today = date.today()
+        for offset in [1, 2, 4, 5, 6]:
+            Completion.objects.create(streak=self.streak, date_completed=today - timedelta(days=offset))
+        Completion.objects.create(streak=self.streak, date_completed=today - timedelta(days=3))
+        self.streak.refresh_from_db()
+        self.assertEqual(self.streak.longest_streak, 6)
+        self.assertEqual(self.streak.current_streak, 6)
+        self.assertEqual(self.streak.days_completed, 6)
+
+    def test_adding_far_from_today_reads_only_nearby_dates(self):
+        today = date.today()
+        for offset in range(0, 400, 2):
+            Completion.objects.create(streak=self.streak, date_completed=today - timedelta(days=offset))
+        self.streak.refresh_from_db()
+        # insert, streak fetch, one windowed date read, stats update
+        with self.assertNumQueries(4):
+            Completion.objects.create(streak=self.streak, date_completed=today - timedelta(days=201))
+        self.assert_matches_full_rebuild()
+
+    def test_first_and_last_days_of_the_calendar(self):
+        client = APIClient()
+        days = [date.min, date.min + ONE_DAY, date.max - ONE_DAY, date.max]
+        for day in days:
+            response = client.post(
+                '/api/completions/', {'streak': self.streak.id, 'date_completed': day.isoformat()}, format='json'
+            )
+            self.assertEqual(response.status_code, 201, day)
+            self.assert_matches_full_rebuild()
+        self.assertEqual(self.streak.longest_streak, 2)
+        for completion in Completion.objects.filter(streak=self.streak):
+            self.assertEqual(client.delete(f'/api/completions/{completion.id}/').status_code, 204)
+            self.assert_matches_full_rebuild()
+
+    def test_moving_a_completion_updates_both_streaks(self):
+        cache.clear()
+        client = APIClient()
+        other = User.objects.create(username='walker')
+        client.force_authenticate(self.user)
+        target = Streak.objects.create(user=other, name='Walk', start_date=date.today(), color='blue')
+        completion = Completion.objects.create(streak=self.streak, date_completed=date.today())
+        self.assertEqual(client.get('/api/streaks/my_streaks/')['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(f'/api/completions/{completion.id}/', {'streak': target.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.streak.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((self.streak.current_streak, self.streak.days_completed), (0, 0))
+        self.assertEqual((target.current_streak, target.days_completed), (1, 1))
+        response = client.get('/api/streaks/my_streaks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['completions'], [])
+
+
+class ToggleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='toggler')
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        self.streak = Streak.objects.create(
+            user=self.user, name='Toggle', start_date=self.today - timedelta(days=60), color='orange'
+        )
+        self.url = f'/api/streaks/{self.streak.id}/toggle/'
+
+    def toggle(self, query=''):
+        response = self.client.post(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_flip_today(self):
+        body = self.toggle()
+        self.assertEqual(body, {
+            'date': self.today.isoformat(), 'completed': True,
+            'streak': {'id': self.streak.id, 'current_streak': 1, 'longest_streak': 1, 'days_completed': 1},
+        })
+        completion = Completion.objects.get(streak=self.streak)
+        self.assertEqual((completion.date_completed, completion.day_of_week), (self.today, self.today.weekday()))
+        body = self.toggle()
+        self.assertEqual((body['completed'], body['streak']['days_completed']), (False, 0))
+        self.assertFalse(Completion.objects.exists())
+
+    def test_completed_parameter_is_idempotent(self):
+        day = (self.today - ONE_DAY).isoformat()
+        for _ in range(2):
+            self.assertTrue(self.toggle(f'date={day}&completed=true')['completed'])
+        self.assertEqual(Completion.objects.count(), 1)
+        # Nothing to write the second time: lock and statement, inside the test's savepoint
+        with self.assertNumQueries(4):
+            self.toggle(f'date={day}&completed=true')
+        for _ in range(2):
+            self.assertFalse(self.toggle(f'date={day}&completed=false')['completed'])
+        self.assertEqual(Completion.objects.count(), 0)
+
+    def test_random_toggles_match_full_rebuild(self):
+        rng = random.Random(20)
+        for _ in range(120):
+            self.toggle(f'date={self.today - timedelta(days=rng.randint(-2, 25))}')
+            self.streak.refresh_from_db()
+            incremental = (self.streak.current_streak, self.streak.longest_streak, self.streak.days_completed)
+            self.streak.recalculate_stats()
+            self.assertEqual(incremental, (self.streak.current_streak, self.streak.longest_streak, self.streak.days_completed))
+
+    def test_first_and_last_days_of_the_calendar(self):
+        for day in [date.max - ONE_DAY, date.max, date.min, date.min + ONE_DAY]:
+            self.assertTrue(self.toggle(f'date={day}')['completed'])
+        for day, left in [(date.max, 3), (date.min, 2)]:
+            body = self.toggle(f'date={day}')
+            self.assertEqual((body['completed'], body['streak']['days_completed']), (False, left))
+        self.streak.refresh_from_db()
+        self.assertEqual(self.streak.longest_streak, 1)
+
+    def test_invalidates_dashboard(self):
+        self.client.get('/api/streaks/my_streaks/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.toggle()
+        response = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()[0]['completions']), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post(f'{self.url}?date=yesterday').status_code, 400)
+        self.assertEqual(self.client.post(f'{self.url}?completed=maybe').status_code, 400)
+        self.assertEqual(self.client.post('/api/streaks/0/toggle/').status_code, 404)
+
+
+class RecomputeStatsTests(TestCase):
+    """The SQL recompute must agree with Streak.recalculate_stats()."""
+
+    def test_matches_python_rebuild(self):
+        user = User.objects.create(username='auditor')
+        today = date.today()
+        rng = random.Random(3)
+        streaks = []
+        for color in Color.values[:8]:
+            streak = Streak.objects.create(user=user, name=color, start_date=today, color=color)
+            # bulk_create skips the signals, so every streak starts with stale stats
+            Completion.objects.bulk_create([
+                Completion(streak=streak, date_completed=today - timedelta(days=d))
+                for d in range(-3, 120) if rng.random() < rng.choice([0.3, 0.8, 0.95])
+            ])
+            streaks.append(streak)
+        empty = Streak.objects.create(
+            user=user, name='Empty', start_date=today, color=Color.STONE, current_streak=5, days_completed=9
+        )
+        streaks.append(empty)
+
+        with self.assertNumQueries(1):
+            updated = Streak.objects.filter(user=user).recompute_stats()
+        self.assertEqual(updated, len(streaks))
+        self.assertEqual(Streak.objects.filter(user=user).recompute_stats(), 0)
+
+        for streak in streaks:
+            streak.refresh_from_db()
+            from_sql = (streak.current_streak, streak.longest_streak, streak.days_completed)
+            streak.recalculate_stats()
+            self.assertEqual(from_sql, (streak.current_streak, streak.longest_streak, streak.days_completed))
+
+    def test_empty_querysets_do_nothing(self):
+        for streaks in [Streak.objects.none(), Streak.objects.filter(id__in=[])]:
+            with self.assertNumQueries(0):
+                self.assertEqual(streaks.recompute_stats(), 0)
+
+
+class RollOverTests(TestCase):
+    def test_only_broken_and_preentered_streaks_change(self):
+        user = User.objects.create(username='sleeper')
+        today = date.today()
+        streaks = {}
+        for color, offsets in [('red', [1, 2]), ('blue', [0, 1]), ('green', [2, 3, 4]), ('gray', [-1, 0, 1])]:
+            streak = Streak.objects.create(user=user, name=color, start_date=today, color=color)
+            Completion.objects.bulk_create([
+                Completion(streak=streak, date_completed=today - timedelta(days=d)) for d in offsets
+            ])
+            streaks[color] = streak
+        # Stats as they were computed the day before
+        Streak.objects.recompute_stats()
+        Streak.objects.filter(id__in=[s.id for s in streaks.values()]).update(current_streak=2)
+        Streak.objects.filter(id=streaks['green'].id).update(current_streak=3)
+        Streak.objects.filter(id=streaks['gray'].id).update(current_streak=1)
+
+        self.assertEqual(Streak.objects.roll_over(batch_size=2), 2)
+        current = dict(Streak.objects.values_list('color', 'current_streak'))
+        self.assertEqual(current, {'red': 2, 'blue': 2, 'green': 0, 'gray': 2})
+
+    def test_batches_skip_gaps_in_the_ids(self):
+        user = User.objects.create(username='dozer')
+        for streak_id, color in [(10 ** 6, 'red'), (10 ** 6 + 1000, 'blue'), (10 ** 6 + 2000, 'green')]:
+            Streak.objects.create(id=streak_id, user=user, name=color, start_date=date.today(), color=color,
+                                  current_streak=4)
+        # Two reads and two updates for the three broken streaks, one empty read, the recompute
+        with self.assertNumQueries(6):
+            self.assertEqual(Streak.objects.roll_over(batch_size=2), 3)
+        self.assertEqual(set(Streak.objects.values_list('current_streak', flat=True)), {0})
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_streaks(self):
+        call_command('seed_streaks', users=3, streaks=2, years=0.25, random_seed=1, stdout=StringIO())
+        streaks = Streak.objects.filter(user__username__startswith='seed')
+        self.assertEqual(streaks.count(), 6)
+        self.assertTrue(Completion.objects.filter(streak__in=streaks).exists())
+        for completion in Completion.objects.filter(streak__in=streaks)[:50]:
+            self.assertEqual(completion.day_of_week, completion.date_completed.weekday())
+        # Seeded with correct stats
+        self.assertEqual(streaks.recompute_stats(), 0)
+        with self.assertRaises(CommandError):
+            call_command('seed_streaks', users=1, stdout=StringIO())
+
+    def test_benchmark_writes_results_and_undoes_toggles(self):
+        call_command('seed_streaks', users=2, streaks=2, years=0.1, stdout=StringIO())
+        completions = list(Completion.objects.order_by('id').values_list('streak_id', 'date_completed'))
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark', requests=5, warmup=2, users=2, output=output.name, stdout=StringIO())
+            results = json.load(output)
+        self.assertEqual(set(results['scenarios']), {'dashboard', 'toggle', 'login'})
+        for result in results['scenarios'].values():
+            self.assertEqual(result['statuses'], {'200': 5})
+            self.assertGreater(result['queries_per_request'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            # The test client reuses this process' connection
+            self.assertEqual(result['connections_opened'], 0)
+        self.assertEqual(
+            sorted(Completion.objects.values_list('streak_id', 'date_completed')), sorted(completions)
+        )
+
+        baseline = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as previous:
+            json.dump(results, previous)
+            previous.flush()
+            call_command(
+                'benchmark', scenario=['dashboard'], requests=2, warmup=0, users=1,
+                baseline=previous.name, stdout=baseline,
+            )
+        self.assertIn('p50_ms', baseline.getvalue().split('Compared with')[1])
+
+
+class BulkCompletionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='importer')
+        self.streak = Streak.objects.create(
+            user=self.user, name='Read', start_date=date.today() - timedelta(days=400), color='blue'
+        )
+
+    def payload(self, days):
+        today = date.today()
+        return {'completions': [
+            {'streak': self.streak.id, 'date_completed': (today - timedelta(days=d)).isoformat()}
+            for d in days
+        ]}
+
+    def test_create_skips_existing_days_and_recalculates_once(self):
+        Completion.objects.create(streak=self.streak, date_completed=date.today())
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/completions/bulk/', self.payload(range(365)), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 364)
+        self.assertEqual(Completion.objects.filter(streak=self.streak).count(), 365)
+        self.assertEqual(
+            dict(response.data['streaks'][0]),
+            {'id': self.streak.id, 'current_streak': 365, 'longest_streak': 365, 'days_completed': 365},
+        )
+        weekdays = set(Completion.objects.values_list('date_completed', 'day_of_week'))
+        self.assertTrue(all(day.weekday() == weekday for day, weekday in weekdays))
+
+    def test_delete(self):
+        self.client.post('/api/completions/bulk/', self.payload(range(10)), format='json')
+        response = self.client.delete('/api/completions/bulk/', self.payload([0, 5, 20]), format='json')
+        self.assertEqual(response.data['deleted'], 2)
+        self.streak.refresh_from_db()
+        self.assertEqual(
+            (self.streak.current_streak, self.streak.longest_streak, self.streak.days_completed), (4, 4, 8)
+        )
+
+    def test_unknown_streak_is_rejected(self):
+        response = self.client.post(
+            '/api/completions/bulk/',
+            {'completions': [{'streak': 999, 'date_completed': '2025-01-01'}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Completion.objects.exists())
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='viewer')
+        self.client.force_authenticate(self.user)
+        self.streak = Streak.objects.create(
+            user=self.user, name='Walk', start_date=date.today(), color='green'
+        )
+
+    def test_hit_after_miss(self):
+        first = self.client.get('/api/streaks/my_streaks/')
+        second = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.json(), second.json())
+
+    def test_completion_write_invalidates(self):
+        self.client.get('/api/streaks/my_streaks/')
+        with self.captureOnCommitCallbacks(execute=True):
+            completion = Completion.objects.create(streak=self.streak, date_completed=date.today())
+        response = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['current_streak'], 1)
+        self.assertEqual(len(response.json()[0]['completions']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            completion.delete()
+        response = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual(response.json()[0]['completions'], [])
+
+    def test_other_users_writes_keep_my_cache(self):
+        other = User.objects.create(username='other')
+        self.client.get('/api/streaks/my_streaks/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Streak.objects.create(user=other, name='Swim', start_date=date.today(), color='cyan')
+        self.assertEqual(self.client.get('/api/streaks/my_streaks/')['X-Cache'], 'HIT')
+        # The unfiltered list spans every user
+        self.client.get('/api/streaks/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Streak.objects.create(user=other, name='Row', start_date=date.today(), color='sky')
+        self.assertEqual(len(self.client.get('/api/streaks/').json()), 3)
+
+    def test_moving_a_streak_invalidates_the_previous_owner(self):
+        other = User.objects.create(username='heir')
+        etag = self.client.get('/api/streaks/my_streaks/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/streaks/{self.streak.id}/', {'user': other.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/streaks/my_streaks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), [])
+
+
+class CompletionWindowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='historian')
+        self.client.force_authenticate(self.user)
+        self.streak = Streak.objects.create(
+            user=self.user, name='Write', start_date=date.today() - timedelta(days=1000), color='violet'
+        )
+        self.today = date.today()
+        Completion.objects.bulk_create([
+            Completion(streak=self.streak, date_completed=self.today - timedelta(days=d)) for d in range(1000)
+        ])
+
+    def completion_dates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        streak = body[0] if isinstance(body, list) else body
+        return sorted(c['date_completed'] for c in streak['completions'])
+
+    def test_default_window_is_bounded(self):
+        with self.settings(COMPLETION_WINDOW_DAYS=30):
+            dates = self.completion_dates('/api/streaks/my_streaks/')
+        self.assertEqual(len(dates), 30)
+        self.assertEqual(dates[0], (self.today - timedelta(days=29)).isoformat())
+
+    def test_days_since_and_until(self):
+        self.assertEqual(len(self.completion_dates('/api/streaks/?days=7')), 7)
+        since = (self.today - timedelta(days=20)).isoformat()
+        until = (self.today - timedelta(days=11)).isoformat()
+        dates = self.completion_dates(f'/api/streaks/{self.streak.id}/?since={since}&until={until}')
+        self.assertEqual((dates[0], dates[-1], len(dates)), (since, until, 10))
+
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get('/api/streaks/?days=0').status_code, 400)
+        for path in ['/api/streaks/', f'/api/streaks/{self.streak.id}/', '/api/streaks/my_streaks/']:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(f'{path}?days=1000000').status_code, 400)
+                self.assertEqual(self.client.get(f'{path}?days=36500').status_code, 200)
+        self.assertEqual(self.client.get('/api/streaks/?since=2025-01-01&days=3').status_code, 400)
+
+
+class CompletionBitmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='packer')
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        self.streak = Streak.objects.create(
+            user=self.user, name='Stretch', start_date=self.today - timedelta(days=500), color='pink'
+        )
+        rng = random.Random(7)
+        Completion.objects.bulk_create([
+            Completion(streak=self.streak, date_completed=self.today - timedelta(days=d))
+            for d in range(-3, 600) if d < 3 or rng.random() < 0.7
+        ])
+
+    def test_round_trip_matches_full_form(self):
+        for query in ['days=400', f'since={(self.today - timedelta(days=550)).isoformat()}', 'days=1']:
+            # The bitmap ends today unless until says otherwise
+            full = self.client.get(f'/api/streaks/my_streaks/?{query}&until={self.today}').json()[0]
+            packed = self.client.get(f'/api/streaks/my_streaks/?{query}&encoding=bitmap').json()[0]
+            self.assertNotIn('completions', packed)
+            self.assertEqual(
+                [day.isoformat() for day in decode_days(packed['completion_bitmap'])],
+                sorted(c['date_completed'] for c in full['completions']),
+            )
+            self.assertEqual(
+                {k: v for k, v in packed.items() if k != 'completion_bitmap'},
+                {k: v for k, v in full.items() if k != 'completions'},
+            )
+
+    def test_far_future_completion_does_not_grow_the_bitmap(self):
+        Completion.objects.create(streak=self.streak, date_completed=date.max)
+        for path in ['/api/streaks/my_streaks/', '/api/streaks/', f'/api/streaks/{self.streak.id}/']:
+            with self.subTest(path=path):
+                body = self.client.get(f'{path}?days=10&encoding=bitmap').json()
+                bitmap = (body[0] if isinstance(body, list) else body)['completion_bitmap']
+                self.assertLessEqual(bitmap['length'], 10)
+                self.assertEqual(decode_days(bitmap)[-1], self.today)
+        ahead = (self.today + timedelta(days=3)).isoformat()
+        packed = self.client.get(f'/api/streaks/my_streaks/?days=10&until={ahead}&encoding=bitmap').json()[0]
+        self.assertEqual(decode_days(packed['completion_bitmap'])[-1].isoformat(), ahead)
+
+    def test_runs(self):
+        origin = date(2025, 1, 1)
+        days = [origin + timedelta(days=d) for d in [0, 1, 2, 5, 6, 9, 10, 11, 12]]
+        encoded = encode_days(days, origin, today=origin + timedelta(days=13))
+        self.assertEqual(encoded['length'], 13)
+        self.assertEqual(encoded['current_run'], {'start': days[5], 'end': days[-1]})
+        self.assertEqual(encoded['longest_run'], {'start': days[5], 'end': days[-1]})
+        self.assertEqual(decode_days(encoded), days)
+        empty = encode_days([], origin)
+        self.assertEqual((empty['bits'], empty['current_run'], empty['longest_run']), ('', None, None))
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='pager')
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        self.streaks = [
+            Streak.objects.create(user=self.user, name=f'Page {i}', start_date=self.today, color=color)
+            for i, color in enumerate(Color.values[:5])
+        ]
+        # Every day has several completions, so pages split inside a day
+        Completion.objects.bulk_create([
+            Completion(streak=streak, date_completed=self.today - timedelta(days=d))
+            for streak in self.streaks for d in range(7)
+        ])
+
+    def walk(self, url):
+        rows, pages = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                body = self.client.get(url).json()
+            self.assertEqual(len(queries), 1)
+            rows += body['results']
+            url, pages = body['next'], pages + 1
+        return rows, pages
+
+    def test_completion_pages_in_date_then_id_order(self):
+        rows, pages = self.walk('/api/completions/?page_size=4')
+        expected = list(Completion.objects.order_by('date_completed', 'id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertEqual(pages, 9)
+
+    def test_completion_list_pages_only_on_request(self):
+        body = self.client.get('/api/completions/').json()
+        self.assertEqual(sorted(row['id'] for row in body), sorted(Completion.objects.values_list('id', flat=True)))
+
+    def test_streak_list_pages_only_on_request(self):
+        self.assertEqual(len(self.client.get('/api/streaks/').json()), 5)
+        first = self.client.get('/api/streaks/?page_size=2&fields=id').json()
+        self.assertEqual(first['results'], [{'id': streak.id} for streak in self.streaks[:2]])
+        rest = self.client.get(first['next']).json()
+        self.assertEqual([row['id'] for row in rest['results']], [streak.id for streak in self.streaks[2:4]])
+
+    def test_invalid_cursor(self):
+        for cursor in ['x', base64.urlsafe_b64encode(b'[1]').decode(), base64.urlsafe_b64encode(b'["a", 1]').decode()]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/completions/?cursor={cursor}').status_code, 404)
+
+    def test_fields_without_completions_skip_the_prefetch(self):
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get('/api/streaks/my_streaks/?fields=id,name,current_streak').json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(body[0], {'id': self.streaks[0].id, 'name': 'Page 0', 'current_streak': 0})
+        # Nested completions keep all their fields
+        body = self.client.get(f'/api/streaks/{self.streaks[0].id}/?fields=id,completions&days=1').json()
+        self.assertEqual(set(body), {'id', 'completions'})
+        self.assertEqual(set(body['completions'][0]), {'id', 'streak', 'date_completed', 'day_of_week'})
+        body = self.client.get('/api/completions/?fields=date_completed&page_size=1').json()
+        self.assertEqual(body['results'][0], {'date_completed': (self.today - timedelta(days=6)).isoformat()})
+
+    def test_fields_leave_writes_alone(self):
+        response = self.client.post(
+            '/api/completions/?fields=id', {'streak': self.streaks[0].id, 'date_completed': '2020-01-01'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('date_completed', response.json())
+
+
+class FastSerializerTests(TestCase):
+    """The dashboard fast path must render exactly what StreakSerializer renders."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='fast')
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        rng = random.Random(3)
+        for i, color in enumerate(Color.values[:4]):
+            streak = Streak.objects.create(
+                user=self.user, name=f'Fast {i}', start_date=self.today - timedelta(days=40), color=color,
+                description=None if i % 2 else 'Ünïcode "quoted"',
+            )
+            # The last streak has no completions
+            Completion.objects.bulk_create([
+                Completion(streak=streak, date_completed=self.today - timedelta(days=d), day_of_week=d % 7)
+                for d in range(60) if i < 3 and rng.random() < 0.6
+            ])
+            streak.recalculate_stats()
+
+    def serializer_bytes(self, path, queryset):
+        view = StreakViewSet(action='list', format_kwarg=None, args=(), kwargs={})
+        view.request = Request(APIRequestFactory().get(path))
+        queryset = queryset(view.get_queryset())
+        return JSONRenderer().render(view.get_serializer(queryset, many=True).data)
+
+    def test_byte_identical(self):
+        queries = ['', '?days=7', '?days=1&until=2000-01-01', '?encoding=bitmap', '?encoding=bitmap&days=90',
+                   '?fields=id,completions,user', '?fields=name', '?fields=completion_bitmap&encoding=bitmap']
+        for query in queries:
+            with self.subTest(query=query):
+                # Unordered like the views, so both read the rows in the same (heap) order
+                for path, queryset in [
+                    (f'/api/streaks/{query}', lambda streaks: streaks),
+                    (f'/api/streaks/my_streaks/{query}', lambda streaks: streaks.filter(user=self.user)),
+                ]:
+                    response = self.client.get(path)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, self.serializer_bytes(path, queryset))
+
+    def test_pages_are_byte_identical(self):
+        body = self.client.get('/api/streaks/?page_size=3').json()
+        expected = self.serializer_bytes('/api/streaks/', lambda streaks: streaks.order_by('id')[:3])
+        self.assertEqual(JSONRenderer().render(body['results']), expected)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='poller')
+        self.client.force_authenticate(self.user)
+        self.streak = Streak.objects.create(user=self.user, name='Poll', start_date=date.today(), color='amber')
+        Completion.objects.create(streak=self.streak, date_completed=date.today())
+
+    def assert_not_modified(self, url, etag, queries=0):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(response['ETag'], etag)
+        # Answered before the dashboard cache or the serializer is touched
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(len(captured), queries)
+
+    def test_unchanged_dashboards_are_not_resent(self):
+        for url in ['/api/streaks/my_streaks/', '/api/streaks/', '/api/streaks/?encoding=bitmap']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Cache-Control'], 'private, no-cache')
+                self.assert_not_modified(url, response['ETag'])
+        response = self.client.get(f'/api/streaks/{self.streak.id}/')
+        self.assert_not_modified(f'/api/streaks/{self.streak.id}/', response['ETag'], queries=1)
+
+    def test_changes_and_variants_get_new_tags(self):
+        url = '/api/streaks/my_streaks/'
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(f'{url}?days=7')['ETag'], etag)
+        self.assertNotEqual(self.client.get(url, HTTP_ACCEPT='text/html')['ETag'], etag)
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='neighbour'))
+        self.assertNotEqual(other.get(url)['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Completion.objects.create(streak=self.streak, date_completed=date.today() - ONE_DAY)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()[0]['completions']), 2)
+
+
+class FastJSONRendererTests(TestCase):
+    DATA = {
+        'text': 'Ünïcode \u2028\u2029 "quoted" \x00 </script>',
+        'numbers': [0, -1, 2 ** 63, 2 ** 70, 1.5],
+        'day': date(2026, 1, 2),
+        'nested': ReturnList([{1: None, 'ok': True}], serializer=None),
+    }
+
+    def test_same_bytes_as_json_renderer(self):
+        expected = JSONRenderer().render(self.DATA)
+        self.assertEqual(FastJSONRenderer().render(self.DATA), expected)
+        with mock.patch('streakApp.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.DATA), expected)
+        self.assertEqual(
+            FastJSONRenderer().render(self.DATA, 'application/json; indent=2'),
+            JSONRenderer().render(self.DATA, 'application/json; indent=2'),
+        )
+
+
+class AggregatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='charts')
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        self.streak = Streak.objects.create(
+            user=self.user, name='Chart', start_date=self.today - timedelta(days=59), color='indigo'
+        )
+        rng = random.Random(19)
+        # Some completed before start_date, which count everywhere but in the rate
+        self.days = [self.today - timedelta(days=d) for d in range(90) if rng.random() < 0.5]
+        for day in self.days:
+            Completion.objects.create(streak=self.streak, date_completed=day)
+        self.url = f'/api/streaks/{self.streak.id}/aggregates/'
+
+    def counts(self, key):
+        counts = {}
+        for day in self.days:
+            counts[key(day)] = counts.get(key(day), 0) + 1
+        return [{'start': start.isoformat(), 'count': count} for start, count in sorted(counts.items())]
+
+    def test_matches_python_grouping(self):
+        body = self.client.get(self.url).json()
+        self.assertEqual(body['weekdays'], [sum(day.weekday() == i for day in self.days) for i in range(7)])
+        self.assertEqual(body['months'], self.counts(lambda day: day.replace(day=1)))
+        self.assertEqual(body['weeks'], self.counts(lambda day: day - timedelta(days=day.weekday())))
+        completed = sum(day >= self.streak.start_date for day in self.days)
+        self.assertEqual(
+            (body['days_since_start'], body['completed_since_start'], body['completion_rate']),
+            (60, completed, completed / 60),
+        )
+
+    def test_cached_until_a_completion_changes(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        self.assertEqual(len(queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Completion.objects.filter(streak=self.streak, date_completed=self.days[0]).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(sum(response.json()['weekdays']), len(self.days) - 1)
+
+    def test_future_start(self):
+        streak = Streak.objects.create(
+            user=self.user, name='Later', start_date=self.today + timedelta(days=3), color='lime'
+        )
+        body = self.client.get(f'/api/streaks/{streak.id}/aggregates/').json()
+        self.assertEqual(body, {
+            'weekdays': [0] * 7, 'months': [], 'weeks': [],
+            'days_since_start': 0, 'completed_since_start': 0, 'completion_rate': None,
+        })
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.users = [User.objects.create(username=f'racer{i}') for i in range(3)]
+        colors = iter(Color.values)
+        # racer0: runs of 5 and 2 days, racer1: 3 days, racer2: an inactive 9 day run
+        for user, runs, active in [
+            (self.users[0], [5, 2], True), (self.users[1], [3], True), (self.users[2], [9], False)
+        ]:
+            for days in runs:
+                streak = Streak.objects.create(
+                    user=user, name='Run', start_date=self.today - timedelta(days=30), color=next(colors),
+                    is_active=active,
+                )
+                for offset in range(days):
+                    Completion.objects.create(streak=streak, date_completed=self.today - timedelta(days=offset))
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[1])
+
+    def test_top_streaks_are_live(self):
+        response = self.client.get('/api/leaderboard/streaks/')
+        self.assertEqual(
+            [(row['rank'], row['username'], row['current_streak']) for row in response.json()],
+            [(1, 'racer0', 5), (2, 'racer1', 3), (3, 'racer0', 2)],
+        )
+        self.assertEqual(len(self.client.get('/api/leaderboard/streaks/?limit=1').json()), 1)
+        for limit in ['0', '101', 'x']:
+            self.assertEqual(self.client.get(f'/api/leaderboard/streaks/?limit={limit}').status_code, 400)
+        self.assertEqual(APIClient().get('/api/leaderboard/streaks/').status_code, 403)
+
+    def test_weekly_activity_and_totals_after_refresh(self):
+        self.assertEqual(self.client.get('/api/leaderboard/active/').json()['results'], [])
+        call_command('refresh_leaderboard', stdout=StringIO())
+
+        week = leaderboard.week_start()
+        this_week = Completion.objects.filter(date_completed__gte=week, date_completed__lt=week + timedelta(days=7))
+        expected = sorted(
+            ((user.username, this_week.filter(streak__user=user).count()) for user in self.users),
+            key=lambda row: -row[1],
+        )
+        response = self.client.get('/api/leaderboard/active/').json()
+        self.assertEqual(response['week'], week.isoformat())
+        self.assertEqual([(row['username'], row['completions']) for row in response['results']], expected)
+        self.assertEqual([row['rank'] for row in response['results']], [1, 2, 3])
+
+        stats = self.client.get('/api/leaderboard/stats/').json()
+        self.assertEqual(
+            {key: value for key, value in stats.items() if key != 'refreshed_at'},
+            {
+                'completions': 19, 'completions_this_week': this_week.count(), 'completions_today': 4,
+                'streaks': 4, 'active_streaks': 3, 'users': 3, 'active_users_this_week': 3,
+            },
+        )
+
+        # Counted again on the next refresh only
+        Completion.objects.filter(streak__user=self.users[2]).delete()
+        self.assertEqual(self.client.get('/api/leaderboard/stats/').json()['completions'], 19)
+        leaderboard.refresh()
+        self.assertEqual(self.client.get('/api/leaderboard/stats/').json()['completions'], 10)
+        self.assertEqual(len(self.client.get('/api/leaderboard/active/').json()['results']), 2)
+
+
+@override_settings(ROOT_URLCONF='streakApp.tests')
+class HistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='history')
+        self.streak = Streak.objects.create(
+            user=self.user, name='Read, "daily"', start_date=date(2024, 1, 1), color=Color.RED,
+            description='Pages\nand chapters \u2028 ü',
+        )
+        for day in [1, 2, 4]:
+            Completion.objects.create(streak=self.streak, date_completed=date(2024, 1, day))
+        self.paused = Streak.objects.create(
+            user=self.user, name='Paused', start_date=date(2024, 2, 1), color=Color.BLUE, is_active=False
+        )
+        Streak.objects.create(user=User.objects.create(username='stranger'), name='Not mine',
+                              start_date=date(2024, 1, 1), color=Color.GRAY)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, format):
+        response = self.client.get(f'/api/streaks/export/?format={format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="streaks.{format}"')
+        return b''.join(response.streaming_content)
+
+    def import_file(self, body, format, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.user)
+        content_type = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}[format]
+        return client.post('/api/streaks/import/', body, content_type=content_type)
+
+    def test_csv_export(self):
+        s, p = self.streak.id, self.paused.id
+        self.assertEqual(self.export('csv').decode().split('\r\n'), [
+            'type,streak,name,color,description,start_date,is_active,date_completed',
+            f'streak,{s},"Read, ""daily""",red,"Pages\nand chapters \u2028 ü",2024-01-01,true,',
+            f'streak,{p},Paused,blue,,2024-02-01,false,',
+            f'completion,{s},,,,,,2024-01-01',
+            f'completion,{s},,,,,,2024-01-02',
+            f'completion,{s},,,,,,2024-01-04',
+            '',
+        ])
+        self.assertEqual(self.client.get('/api/streaks/export/').get('Content-Type'), 'text/csv; charset=utf-8')
+
+    def test_ndjson_export(self):
+        body = self.export('ndjson')
+        # Only ASCII, so no line breaks but the newlines between records
+        self.assertTrue(body.isascii())
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(records, [
+            {'type': 'streak', 'streak': self.streak.id, 'name': 'Read, "daily"', 'color': 'red',
+             'description': 'Pages\nand chapters \u2028 ü', 'start_date': '2024-01-01', 'is_active': True},
+            {'type': 'streak', 'streak': self.paused.id, 'name': 'Paused', 'color': 'blue',
+             'description': None, 'start_date': '2024-02-01', 'is_active': False},
+            *({'type': 'completion', 'streak': self.streak.id, 'date_completed': f'2024-01-0{day}'}
+              for day in [1, 2, 4]),
+        ])
+        response = self.client.get('/api/streaks/export/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(b''.join(response.streaming_content), self.export('ndjson'))
+
+    def test_import_into_another_account(self):
+        fields = ('name', 'color', 'description', 'start_date', 'is_active', 'current_streak',
+                  'longest_streak', 'days_completed')
+        for format in ['csv', 'ndjson']:
+            with self.subTest(format=format), transaction.atomic():
+                body = self.export(format)
+                before = list(Streak.objects.filter(user=self.user).order_by('color').values_list(*fields))
+                days = sorted(self.streak.completion_set.values_list('date_completed', flat=True))
+                # Colors are unique across users
+                Streak.objects.filter(user=self.user).delete()
+                user = User.objects.create(username=f'new-{format}')
+
+                response = self.import_file(body, format, user)
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.json(), {'streaks_created': 2, 'completions_added': 3})
+                self.assertEqual(
+                    list(Streak.objects.filter(user=user).order_by('color').values_list(*fields)), before
+                )
+                imported = Completion.objects.filter(streak__user=user)
+                self.assertEqual(sorted(imported.values_list('date_completed', flat=True)), days)
+                self.assertEqual({c.day_of_week for c in imported}, {day.weekday() for day in days})
+                transaction.set_rollback(True)
+
+    def test_import_into_same_account_adds_what_is_missing(self):
+        body = self.export('csv')
+        self.client.get('/api/streaks/my_streaks/')
+        Completion.objects.filter(date_completed=date(2024, 1, 2)).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.import_file(body, 'csv')
+        self.assertEqual(response.json(), {'streaks_created': 0, 'completions_added': 1})
+        self.streak.refresh_from_db()
+        self.assertEqual((self.streak.days_completed, self.streak.longest_streak), (3, 2))
+        self.assertEqual(self.client.get('/api/streaks/my_streaks/')['X-Cache'], 'MISS')
+
+    def test_invalid_line_rejects_the_file(self):
+        header = 'type,streak,name,color,start_date,date_completed\n'
+        for body, error in [
+            (header + 'streak,1,New,cyan,2024-01-01,\ncompletion,2,,,,2024-01-01\n',
+             {'line': '3', 'streak': ['No streak with this id earlier in the file.']}),
+            (header + 'streak,1,New,cyan,2024-01-01,\ncompletion,1,,,,yesterday\n',
+             {'line': '3', 'date_completed': ['Expected a YYYY-MM-DD date.']}),
+            (header + 'streak,1,New,gray,2024-01-01,\n',
+             {'line': '2', 'color': ['streak with this color already exists.']}),
+            (header + 'habit,1,New,cyan,2024-01-01,\n', {'line': '2', 'type': ['Expected "streak" or "completion".']}),
+            ('name,color\n', {'detail': 'Line 1: expected the header row, with a type column.'}),
+        ]:
+            with self.subTest(body=body):
+                response = self.import_file(body, 'csv')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), error)
+        response = self.import_file('\n[1]\n', 'ndjson')
+        self.assertEqual(response.json(), {'detail': 'Line 2: expected a JSON object.'})
+        self.assertEqual(self.import_file(b'\xff\n', 'csv').status_code, 400)
+        self.assertFalse(Streak.objects.filter(name='New').exists())
+
+    def test_empty_files(self):
+        for body, format in [
+            ('type,streak,name,color,description,start_date,is_active,date_completed\r\n', 'csv'),
+            ('', 'ndjson'),
+            ('\n\n', 'ndjson'),
+        ]:
+            with self.subTest(body=body, format=format):
+                response = self.import_file(body, format)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), {'streaks_created': 0, 'completions_added': 0})
+
+    @override_settings(API_TOKEN_AUTH=True)
+    def test_bearer_token(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user)}')
+        body = self.export('ndjson')
+        self.assertEqual(body.count(b'\n'), 5)
+        Completion.objects.filter(date_completed=date(2024, 1, 4)).delete()
+        Streak.objects.filter(color=Color.BLUE).delete()
+        response = self.client.post('/api/streaks/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json(), {'streaks_created': 1, 'completions_added': 1})
+        self.assertEqual(Streak.objects.get(color=Color.BLUE).user, self.user)
+
+    def test_requires_login(self):
+        self.assertEqual(APIClient().get('/api/streaks/export/').status_code, 403)
+        self.assertEqual(APIClient().post('/api/streaks/import/', 'type\n', content_type='text/csv').status_code, 403)
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/async/streaks/export/?format=ndjson')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, await sync_to_async(self.export)('ndjson'))
+
+    def test_memory_does_not_grow_with_history(self):
+        """Peak memory of an export and an import, measured at two history sizes."""
+        factory = APIRequestFactory()
+        # The router passes the renderers and parsers of an action the same way
+        export_view = StreakViewSet.as_view({'get': 'export'}, **StreakViewSet.export.kwargs)
+        import_view = StreakViewSet.as_view({'post': 'import_history'}, **StreakViewSet.import_history.kwargs)
+        peaks = []
+        for size in [5_000, 25_000]:
+            with transaction.atomic():
+                Streak.objects.all().delete()
+                user = User.objects.create(username=f'memory{size}')
+                streaks = [
+                    Streak.objects.create(user=user, name='Long', start_date=date(2000, 1, 1), color=color)
+                    for color in Color.values[:10]
+                ]
+                Completion.objects.bulk_create([
+                    Completion(streak=streak, date_completed=date(2000, 1, 1) + timedelta(days=day))
+                    for streak in streaks for day in range(size // len(streaks))
+                ])
+                request = factory.get('/api/streaks/export/?format=ndjson')
+                force_authenticate(request, user)
+                tracemalloc.start()
+                exported = 0
+                for chunk in export_view(request).streaming_content:
+                    exported += chunk.count(b'\n')
+                export_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.assertEqual(exported, size + len(streaks))
+
+                # Back into the same account, as a CSV body built ahead of the measurement
+                body = 'type,streak,color,date_completed\n' + ''.join(
+                    f'streak,{streak.id},{streak.color},\n' for streak in streaks
+                ) + ''.join(
+                    f'completion,{streak.id},,{date(2000, 1, 1) - timedelta(days=day + 1)}\n'
+                    for streak in streaks for day in range(size // len(streaks))
+                )
+                request = factory.post('/api/streaks/import/', body, content_type='text/csv')
+                force_authenticate(request, user)
+                del body
+                tracemalloc.start()
+                response = import_view(request)
+                import_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.assertEqual(response.data, {'streaks_created': 0, 'completions_added': size})
+                peaks.append((export_peak, import_peak))
+                transaction.set_rollback(True)
+        (small_export, small_import), (large_export, large_import) = peaks
+        # Both sizes are several chunks long, five times the history takes the same memory
+        self.assertLess(large_export, small_export * 1.1)
+        self.assertLess(large_import, small_import * 1.1)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Pin the number of queries every API route runs, whatever the data size.
+
+    A new route fails test_every_route_has_a_budget until it is added to BUDGETS.
+    """
+    # (url name, method): queries
+    BUDGETS = {
+        ('api-root', 'get'): 0,
+        ('streak-list', 'get'): 2,
+        ('streak-list', 'post'): 4,
+        ('streak-my-streaks', 'get'): 2,
+        ('streak-detail', 'get'): 2,
+        ('streak-detail', 'put'): 6,
+        ('streak-detail', 'patch'): 4,
+        ('streak-detail', 'delete'): 4,
+        ('streak-aggregates', 'get'): 4,
+        ('streak-toggle', 'post'): 5,
+        ('streak-export', 'get'): 2,
+        ('streak-import', 'post'): 7,
+        ('completion-list', 'get'): 1,
+        ('completion-list', 'post'): 6,
+        ('completion-detail', 'get'): 1,
+        ('completion-detail', 'put'): 8,
+        ('completion-detail', 'patch'): 7,
+        ('completion-detail', 'delete'): 5,
+        ('completion-bulk', 'post'): 7,
+        ('completion-bulk', 'delete'): 8,
+        ('user-list', 'get'): 1,
+        ('user-list', 'post'): 2,
+        ('user-detail', 'get'): 1,
+        ('user-detail', 'put'): 3,
+        ('user-detail', 'patch'): 2,
+        ('user-detail', 'delete'): 9,
+        ('user-me', 'get'): 0,
+        ('user-logout', 'post'): 2,
+        ('user-google-initiate', 'get'): 4,
+        ('user-google-callback', 'get'): 1,
+        ('leaderboard-streaks', 'get'): 2,
+        ('leaderboard-active', 'get'): 1,
+        ('leaderboard-stats', 'get'): 1,
+    }
+    SIZES = [(2, 5), (4, 30)]
+    maxDiff = None
+
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, streak_count, completion_count):
+        user = User.objects.create(username=f'budget{streak_count}x{completion_count}')
+        today = date.today()
+        colors = iter(Color.values)
+        streaks = [
+            Streak.objects.create(user=user, name=f'Streak {i}', start_date=today, color=next(colors))
+            for i in range(streak_count)
+        ]
+        for streak in streaks:
+            Completion.objects.bulk_create([
+                Completion(streak=streak, date_completed=today - timedelta(days=d))
+                for d in range(1, completion_count + 1)
+            ])
+            streak.recalculate_stats()
+        return user, streaks
+
+    def requests(self, user, streaks):
+        """Yield (route, callable) pairs covering every budgeted route."""
+        client = APIClient()
+        client.force_authenticate(user)
+        streak = streaks[0]
+        completion = streak.completion_set.first()
+        today = date.today().isoformat()
+        last_year = date.today() - timedelta(days=365)
+        streak_body = {'user': user.id, 'name': 'Renamed', 'start_date': today, 'color': streak.color}
+        completion_body = {'streak': streak.id, 'date_completed': today}
+        bulk_body = {'completions': [completion_body]}
+        yield ('api-root', 'get'), lambda: client.get('/api/')
+        yield ('streak-list', 'get'), lambda: client.get('/api/streaks/')
+        yield ('streak-my-streaks', 'get'), lambda: client.get('/api/streaks/my_streaks/')
+        yield ('streak-detail', 'get'), lambda: client.get(f'/api/streaks/{streak.id}/')
+        yield ('streak-aggregates', 'get'), lambda: client.get(f'/api/streaks/{streak.id}/aggregates/')
+        yield ('streak-toggle', 'post'), lambda: client.post(
+            f'/api/streaks/{streak.id}/toggle/?date={last_year - timedelta(days=7)}'
+        )
+
+        def export():
+            response = client.get('/api/streaks/export/')
+            # The queries run as the body is read
+            b''.join(response.streaming_content)
+            return response
+
+        yield ('streak-export', 'get'), export
+        yield ('streak-import', 'post'), lambda: client.post(
+            '/api/streaks/import/',
+            f'type,streak,color,date_completed\nstreak,1,{streak.color},\ncompletion,1,,{last_year - timedelta(days=30)}\n',
+            content_type='text/csv',
+        )
+        yield ('streak-detail', 'put'), lambda: client.put(f'/api/streaks/{streak.id}/', streak_body, format='json')
+        yield ('streak-detail', 'patch'), lambda: client.patch(f'/api/streaks/{streak.id}/', {'name': 'Patched'})
+        yield ('completion-list', 'get'), lambda: client.get('/api/completions/')
+        yield ('completion-detail', 'get'), lambda: client.get(f'/api/completions/{completion.id}/')
+        yield ('completion-list', 'post'), lambda: client.post('/api/completions/', completion_body, format='json')
+        yield ('completion-detail', 'put'), lambda: client.put(
+            f'/api/completions/{completion.id}/', {**completion_body, 'date_completed': last_year.isoformat()},
+            format='json',
+        )
+        yield ('completion-detail', 'patch'), lambda: client.patch(
+            f'/api/completions/{completion.id}/', {'date_completed': (last_year - timedelta(days=1)).isoformat()},
+            format='json',
+        )
+        yield ('completion-detail', 'delete'), lambda: client.delete(f'/api/completions/{completion.id}/')
+        yield ('completion-bulk', 'post'), lambda: client.post('/api/completions/bulk/', bulk_body, format='json')
+        yield ('completion-bulk', 'delete'), lambda: client.delete('/api/completions/bulk/', bulk_body, format='json')
+        yield ('user-list', 'get'), lambda: client.get('/api/users/')
+        yield ('user-list', 'post'), lambda: client.post('/api/users/', {'username': f'{user.username}-2'})
+        yield ('user-detail', 'get'), lambda: client.get(f'/api/users/{user.id}/')
+        yield ('user-detail', 'put'), lambda: client.put(
+            f'/api/users/{user.id}/', {'username': user.username, 'first_name': 'A'}, format='json'
+        )
+        yield ('user-detail', 'patch'), lambda: client.patch(f'/api/users/{user.id}/', {'first_name': 'B'})
+        yield ('user-me', 'get'), lambda: client.get('/api/users/me/')
+        yield ('leaderboard-streaks', 'get'), lambda: client.get('/api/leaderboard/streaks/')
+        yield ('leaderboard-active', 'get'), lambda: client.get('/api/leaderboard/active/')
+        yield ('leaderboard-stats', 'get'), lambda: client.get('/api/leaderboard/stats/')
+        yield ('user-google-initiate', 'get'), lambda: client.get('/api/users/google/initiate/')
+        # Without a matching OAuth state the callback stops before calling Google
+        yield ('user-google-callback', 'get'), lambda: client.get('/api/users/google/callback/?state=x')
+        yield ('streak-list', 'post'), lambda: client.post(
+            '/api/streaks/', {**streak_body, 'color': Color.STONE}, format='json'
+        )
+        yield ('streak-detail', 'delete'), lambda: client.delete(f'/api/streaks/{streak.id}/')
+        yield ('user-logout', 'post'), lambda: client.post('/api/users/logout/')
+        yield ('user-detail', 'delete'), lambda: client.delete(f'/api/users/{user.id}/')
+
+    def measure(self, streak_count, completion_count):
+        cache.clear()
+        counts = {}
+        user, streaks = self.seed(streak_count, completion_count)
+        for route, send in self.requests(user, streaks):
+            with CaptureQueriesContext(connection) as queries:
+                response = send()
+            self.assertLess(response.status_code, 500, route)
+            counts[route] = len(queries)
+        return counts
+
+    def test_every_route_has_a_budget(self):
+        methods = {'list': ['get', 'post'], 'detail': ['get', 'put', 'patch', 'delete']}
+        routes = set()
+        for url in router.urls:
+            name = url.name
+            suffix = name.rsplit('-', 1)[-1]
+            if name == 'api-root':
+                routes.add((name, 'get'))
+            elif suffix in methods:
+                routes.update((name, method) for method in methods[suffix])
+            else:
+                # DRF adds head to a get action once the view has served a request
+                routes.update((name, method) for method in url.callback.actions if method != 'head')
+        self.assertEqual(routes, set(self.BUDGETS))
+
+    @override_settings(GOOGLE_CLIENT_ID='id', GOOGLE_CLIENT_SECRET='secret')
+    def test_query_counts_do_not_grow_with_data(self):
+        for streak_count, completion_count in self.SIZES:
+            with self.subTest(streaks=streak_count, completions=completion_count), transaction.atomic():
+                self.assertEqual(self.measure(streak_count, completion_count), self.BUDGETS)
+                transaction.set_rollback(True)
+
+
+class RequestLoggingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.streak = Streak.objects.create(
+            user=User.objects.create(username='logger'), name='Log', start_date=date.today(), color='red'
+        )
+
+    @override_settings(REQUEST_LOG_SAMPLE_RATE=1)
+    def test_sampled_request_logs_section_timings(self):
+        with self.assertLogs('streakApp.instrumentation', 'INFO') as logs:
+            response = self.client.post(
+                '/api/completions/', {'streak': self.streak.id, 'date_completed': date.today()}
+            )
+        self.assertEqual(response.status_code, 201)
+        [record] = logs.records
+        self.assertEqual((record.method, record.path, record.status), ('POST', '/api/completions/', 201))
+        self.assertEqual(set(record.timings_ms), {'signals', 'render'})
+        self.assertGreater(record.queries, 0)
+
+        with self.assertLogs('streakApp.instrumentation', 'INFO') as logs:
+            self.client.delete('/api/completions/bulk/', {'completions': [
+                {'streak': self.streak.id, 'date_completed': date.today().isoformat()},
+            ]}, format='json')
+        self.assertEqual(set(logs.records[0].timings_ms), {'recalculate_stats', 'serializer', 'render'})
+
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual(line['message'], 'request')
+        self.assertEqual(line['status'], 201)
+        self.assertIn('duration_ms', line)
+
+    @override_settings(REQUEST_LOG_SAMPLE_RATE=0)
+    def test_unsampled_request_logs_nothing(self):
+        with self.assertNoLogs('streakApp', 'INFO'):
+            self.client.get('/api/streaks/')
+
+    def test_stats_updates_log_at_debug_only(self):
+        with self.assertLogs('streakApp.signals', logging.DEBUG) as logs:
+            Completion.objects.create(streak=self.streak, date_completed=date.today())
+        self.assertEqual(logs.records[0].streak, self.streak.id)
+        with self.assertNoLogs('streakApp.signals', 'INFO'):
+            Completion.objects.create(streak=self.streak, date_completed=date.today() - ONE_DAY)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.requests.clear()
+        self.user = User.objects.create(username='metered')
+        self.streak = Streak.objects.create(user=self.user, name='Meter', start_date=date.today(), color='lime')
+        self.client.force_login(self.user)
+
+    def test_server_timing_counts_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/streaks/{self.streak.id}/toggle/')
+        timing = response['Server-Timing']
+        self.assertEqual(int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', timing)[1]), len(queries))
+        self.assertEqual(
+            [entry.split(';')[0] for entry in timing.split(', ')], ['total', 'db', 'serializer', 'render']
+        )
+
+    def test_unknown_methods_share_one_label(self):
+        for method in ['GET', 'BREW', 'WHEN', 'M-SEARCH']:
+            self.client.generic(method, '/api/streaks/')
+        self.assertEqual(sorted(metrics.requests.views), [('streak-list', 'GET'), ('streak-list', 'other')])
+        self.assertEqual(sum(metrics.requests.views[('streak-list', 'other')].statuses.values()), 3)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/streaks/'))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_metrics_endpoint_is_staff_only(self):
+        for _ in range(2):
+            self.client.get('/api/streaks/')
+        self.client.get('/api/no-such-page/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        anonymous = APIClient().get('/api/metrics/')
+        self.assertEqual((anonymous.status_code, anonymous['WWW-Authenticate']), (401, 'Basic realm="api"'))
+
+        User.objects.create_user(username='ops', password='scrape', is_staff=True)
+        credentials = base64.b64encode(b'ops:scrape').decode()
+        response = APIClient().get('/api/metrics/', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/plain; charset=utf-8'))
+        body = response.content.decode()
+        labels = '{view="streak-list",method="GET"'
+        for line in [
+            '# TYPE streakapp_request_duration_seconds histogram',
+            f'streakapp_request_duration_seconds_bucket{labels},le="+Inf"}} 2',
+            f'streakapp_request_duration_seconds_count{labels}}} 2',
+            f'streakapp_requests_total{labels},status="200"}} 2',
+            'streakapp_requests_total{view="unmatched",method="GET",status="404"} 1',
+        ]:
+            self.assertIn(line, body.splitlines())
+        self.assertRegex(body, r'streakapp_request_queries_bucket\{view="streak-list",method="GET",le="10.0"\} 2')
+        self.assertIn(f'streakapp_section_duration_seconds_total{labels},section="render"}}', body)
+
+
+@override_settings(ROOT_URLCONF='streakApp.tests')
+class AsyncViewTests(TestCase):
+    """The async views must answer exactly like the viewsets they stand in for."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='async')
+        self.streak = Streak.objects.create(
+            user=self.user, name='Async', start_date=date.today() - timedelta(days=5), color='teal'
+        )
+        Streak.objects.create(
+            user=User.objects.create(username='other'), name='Other', start_date=date.today(), color='gray'
+        )
+        for days_ago in range(3):
+            Completion.objects.create(streak=self.streak, date_completed=date.today() - timedelta(days=days_ago))
+        self.client.force_login(self.user)
+
+    async def assert_same(self, method, path, **kwargs):
+        await self.async_client.aforce_login(self.user)
+        expected = await sync_to_async(getattr(self.client, method))(f'/api/{path}', **kwargs)
+        cache.clear()
+        actual = await getattr(self.async_client, method)(f'/async/{path}', **kwargs)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual.content, expected.content)
+        return actual
+
+    async def test_dashboards(self):
+        for path in ['streaks/', 'streaks/?encoding=bitmap&days=2', 'streaks/my_streaks/', 'streaks/?since=x']:
+            with self.subTest(path=path):
+                await self.assert_same('get', path)
+        responses = [await self.async_client.get('/async/streaks/my_streaks/') for _ in range(2)]
+        self.assertEqual([response['X-Cache'] for response in responses], ['MISS', 'HIT'])
+
+    async def test_paginated_dashboard(self):
+        await self.async_client.aforce_login(self.user)
+        expected = (await sync_to_async(self.client.get)('/api/streaks/?page_size=1')).json()
+        actual = (await self.async_client.get('/async/streaks/?page_size=1')).json()
+        self.assertEqual(actual['results'], expected['results'])
+        self.assertEqual(actual['next'], expected['next'].replace('/api/', '/async/'))
+
+    async def test_conditional_get(self):
+        await self.async_client.aforce_login(self.user)
+        for path in ['streaks/', 'streaks/my_streaks/']:
+            with self.subTest(path=path):
+                etag = (await self.async_client.get(f'/async/{path}'))['ETag']
+                response = await self.async_client.get(f'/async/{path}', headers={'If-None-Match': etag})
+                self.assertEqual((response.status_code, response['ETag'], response.content), (304, etag, b''))
+
+    async def test_my_streaks_needs_a_session(self):
+        expected = await sync_to_async(APIClient().get)('/api/streaks/my_streaks/')
+        actual = await self.async_client.get('/async/streaks/my_streaks/')
+        self.assertEqual((actual.status_code, actual.content), (expected.status_code, expected.content))
+
+    async def test_create_and_delete_completion(self):
+        day = date.today() - timedelta(days=4)
+        response = await self.async_client.post(
+            '/async/completions/', {'streak': self.streak.id, 'date_completed': day}
+        )
+        self.assertEqual(response.status_code, 201)
+        completion = await Completion.objects.aget(streak=self.streak, date_completed=day)
+        self.assertEqual(response.json()['id'], completion.id)
+        await self.streak.arefresh_from_db()
+        self.assertEqual(self.streak.days_completed, 4)
+
+        await self.assert_same('post', 'completions/', data={'streak': self.streak.id, 'date_completed': day})
+        await self.assert_same('post', 'completions/', data={'streak': 999, 'date_completed': day})
+
+        response = await self.async_client.delete(f'/async/completions/{completion.id}/')
+        self.assertEqual(response.status_code, 204)
+        await self.streak.arefresh_from_db()
+        self.assertEqual(self.streak.days_completed, 3)
+        await self.assert_same('delete', f'completions/{completion.id}/')
+
+    async def test_server_timing_counts_queries_of_async_views(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/async/streaks/my_streaks/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    async def test_other_methods_fall_through(self):
+        for method in ['head', 'options', 'post']:
+            with self.subTest(method=method):
+                await self.assert_same(method, 'streaks/my_streaks/')
+        await self.assert_same('get', 'completions/')
+        completion = await Completion.objects.afirst()
+        await self.assert_same('get', f'completions/{completion.id}/')
+
+
+class FakeGoogle(BaseHTTPRequestHandler):
+    """Local stand-in for Google's token and userinfo endpoints."""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; keep them from waiting on a delayed ACK
+    disable_nagle_algorithm = True
+    account = {
+        'sub': '1234', 'email': 'ada@example.com', 'picture': 'https://example.com/ada.png',
+        'name': 'Ada Lovelace', 'given_name': 'Ada', 'family_name': 'Lovelace',
+    }
+    # Set by the tests
+    audience = 'client-id'
+    send_id_token = True
+    seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.seen.append((self.path, self.client_address))
+        token = {'access_token': 'access', 'refresh_token': 'refresh', 'expires_in': 3600, 'token_type': 'Bearer'}
+        if self.send_id_token:
+            claims = {**self.account, 'aud': self.audience, 'iss': 'https://accounts.google.com'}
+            segments = [{'alg': 'RS256', 'typ': 'JWT'}, claims]
+            token['id_token'] = '.'.join(
+                base64.urlsafe_b64encode(json.dumps(segment).encode()).decode().rstrip('=') for segment in segments
+            ) + '.c2ln'
+        self.reply(token)
+
+    def do_GET(self):
+        self.seen.append((self.path.split('?')[0], self.client_address))
+        self.reply({'id': self.account['sub'], **{k: v for k, v in self.account.items() if k != 'sub'}})
+
+
+@override_settings(GOOGLE_CLIENT_ID='client-id', GOOGLE_CLIENT_SECRET='secret')
+@mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1', 'FRONTEND_URL': 'http://frontend'})
+class GoogleCallbackTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogle)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        root = f'http://127.0.0.1:{cls.server.server_port}'
+        cls.endpoints = override_settings(GOOGLE_TOKEN_URI=f'{root}/token', GOOGLE_API_ENDPOINT=f'{root}/')
+        cls.endpoints.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.endpoints.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        google_oauth._userinfo_service.cache_clear()
+        FakeGoogle.seen = []
+        FakeGoogle.audience = 'client-id'
+        FakeGoogle.send_id_token = True
+
+    def log_in(self):
+        client = APIClient()
+        state = client.get('/api/users/google/initiate/').data['state']
+        return client.get('/api/users/google/callback/', {'state': state, 'code': 'code'})
+
+    def test_identity_from_id_token_over_one_pooled_connection(self):
+        for _ in range(2):
+            response = self.log_in()
+            self.assertRedirects(response, 'http://frontend/callback', fetch_redirect_response=False)
+        user = User.objects.get(google_id='1234')
+        self.assertEqual(
+            (user.username, user.google_email, user.first_name, user.last_name, user.google_access_token),
+            ('ada', 'ada@example.com', 'Ada', 'Lovelace', 'access'),
+        )
+        # No userinfo round trip, and the second exchange reused the first connection
+        self.assertEqual([path for path, _ in FakeGoogle.seen], ['/token', '/token'])
+        self.assertEqual(FakeGoogle.seen[0][1], FakeGoogle.seen[1][1])
+
+    def test_userinfo_fallback_without_id_token(self):
+        FakeGoogle.send_id_token = False
+        response = self.log_in()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([path for path, _ in FakeGoogle.seen], ['/token', '/oauth2/v2/userinfo'])
+        self.assertEqual(User.objects.get(google_id='1234').google_picture, 'https://example.com/ada.png')
+
+    @override_settings(API_TOKEN_AUTH=True)
+    def test_bearer_token_in_redirect(self):
+        response = self.log_in()
+        self.assertTrue(response['Location'].startswith('http://frontend/callback#token='))
+        token = response['Location'].split('#token=')[1]
+        me = APIClient().get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(me.data['google_access_token'], 'access')
+
+    def test_authorization_url_matches_flow(self):
+        template = google_oauth.FlowTemplate('client-id', 'secret', 'https://token', 'https://app/callback/')
+        url, state = template.authorization_url()
+        expected, _ = template.flow(state).authorization_url(
+            access_type='offline', include_granted_scopes='true', prompt='consent', state=state
+        )
+        parse = lambda url: (url.split('?')[0], parse_qs(url.split('?')[1]))
+        self.assertEqual(parse(url), parse(expected))
+
+    def test_id_token_for_another_client_is_rejected(self):
+        FakeGoogle.audience = 'someone-else'
+        response = self.log_in()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(google_id='1234').exists())
+
+
+class UsernameAllocationTests(TestCase):
+    def test_lowest_free_suffix_in_one_read(self):
+        for username in ['john', 'john_1', 'john_2', 'john_4', 'johnny', 'john_smith']:
+            User.objects.create(username=username)
+        # Read, savepoint, insert, release
+        with self.assertNumQueries(4):
+            self.assertEqual(create_user_with_free_username('john').username, 'john_3')
+        self.assertEqual(create_user_with_free_username('john').username, 'john_5')
+        self.assertEqual(create_user_with_free_username('jane', email='jane@example.com').username, 'jane')
+
+    def test_other_conflicts_are_not_retried(self):
+        User.objects.create(username='taken', google_id='1')
+        with self.assertRaises(IntegrityError):
+            create_user_with_free_username('fresh', google_id='1')
+
+
+class ConcurrentSignupTests(TransactionTestCase):
+    def test_parallel_signups_of_the_same_name(self):
+        signups = 16
+        barrier = threading.Barrier(signups)
+        usernames, errors = [], []
+
+        def sign_up(index):
+            try:
+                barrier.wait()
+                usernames.append(create_user_with_free_username('john', google_id=str(index)).username)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sign_up, args=(index,)) for index in range(signups)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(usernames)), signups)
+        self.assertIn('john', usernames)
+        self.assertTrue(all(re.fullmatch(r'john(_[0-9]+)?', username) for username in usernames))
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='bearer')
+        Streak.objects.create(user=self.user, name='Token', start_date=date.today(), color='lime')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user)}')
+
+    @override_settings(API_TOKEN_AUTH=True)
+    def test_no_session_or_user_lookup(self):
+        # Streaks and their completions only
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual([streak['name'] for streak in response.json()], ['Token'])
+        # The profile itself is the only query
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/users/me/').data['username'], 'bearer')
+
+    def test_ignored_unless_enabled(self):
+        response = self.client.get('/api/streaks/my_streaks/')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('WWW-Authenticate', response)
+
+    @override_settings(API_TOKEN_AUTH=True)
+    def test_tampered_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user)[:-2]}xx')
+        response = self.client.get('/api/streaks/my_streaks/')
+        # Session authentication comes first, so DRF answers 403 rather than 401
+        self.assertEqual((response.status_code, response.data['code']), (403, 'token_not_valid'))
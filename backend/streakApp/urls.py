@@ -1,9 +1,23 @@
+from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, StreakViewSet, CompletionViewSet
+from . import async_views
+from .views import UserViewSet, StreakViewSet, CompletionViewSet, LeaderboardViewSet, metrics
 
 router = DefaultRouter()
 router.register(r'streaks', StreakViewSet)
 router.register(r'completions', CompletionViewSet)
 router.register(r'users', UserViewSet)
+router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 
-urlpatterns = router.urls
\ No newline at end of file
+# Matched ahead of the router when ASYNC_API is on
+async_urlpatterns = [
+    path('streaks/', async_views.streak_list),
+    path('streaks/my_streaks/', async_views.my_streaks),
+    path('completions/', async_views.completion_list),
+    path('completions/<int:pk>/', async_views.completion_detail),
+]
+
+urlpatterns = [path('metrics/', metrics, name='metrics'), *router.urls]
+if settings.ASYNC_API:
+    urlpatterns = async_urlpatterns + urlpatterns
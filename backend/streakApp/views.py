@@ -1,46 +1,432 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.settings import api_settings
 from django.conf import settings
-from django.shortcuts import redirect
+from django.db import transaction
+from django.db.models import Q, Prefetch, prefetch_related_objects
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
-from google_auth_oauthlib.flow import Flow
+from django.utils.cache import get_conditional_response, patch_cache_control
 from google.oauth2.credentials import Credentials
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
+from datetime import date, timedelta
 import os
 import json
+import logging
+
+from .models import Streak, Completion, User, create_user_with_free_username
+from .serializers import (
+    StreakSerializer, CompletionSerializer, UserSerializer,
+    StreakStatsSerializer, CompletionBulkSerializer, CompletionBulkResultSerializer,
+    CompletionWindowSerializer, StreakBitmapSerializer, StreakAggregatesSerializer, requested_fields,
+    CompletionToggleSerializer, CompletionToggleResultSerializer, StreakImportResultSerializer,
+    LeaderboardParamsSerializer,
+    LeaderboardStreakSerializer, WeeklyLeaderboardSerializer, LeaderboardTotalsSerializer,
+)
+from .signals import suspend_stats_updates
+from . import cache as dashboard_cache
+from . import google_oauth
+from . import history
+from . import leaderboard
+from . import fast_serializers
+from . import metrics as request_metrics
+from .authentication import issue_token
+from .pagination import StreakPagination, CompletionPagination
+from .instrumentation import timed
+from .parsers import CSVParser, NDJSONParser
+from .renderers import PrometheusRenderer, CSVRenderer, NDJSONRenderer
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_WINDOW_PARAMETERS = [
+    OpenApiParameter('since', date, description='Only include completions on or after this date.'),
+    OpenApiParameter(
+        'until', date,
+        description='Only include completions on or before this date. Defaults to today with encoding=bitmap.',
+    ),
+    OpenApiParameter(
+        'days', int,
+        description='Only include completions from the last N days, up to 36500. Defaults to COMPLETION_WINDOW_DAYS.',
+    ),
+    OpenApiParameter(
+        'encoding', str, enum=['full', 'bitmap'],
+        description='bitmap replaces the completions list with a compact completion_bitmap object.',
+    ),
+]
+
+FIELDS_PARAMETER = OpenApiParameter(
+    'fields', str,
+    description='Comma separated names of the top level fields to return. Defaults to all.',
+)
 
-from .models import Streak, Completion, User
-from .serializers import StreakSerializer, CompletionSerializer, UserSerializer
 
 # Create your views here.
+@extend_schema_view(
+    list=extend_schema(parameters=[*COMPLETION_WINDOW_PARAMETERS, FIELDS_PARAMETER]),
+    retrieve=extend_schema(parameters=[*COMPLETION_WINDOW_PARAMETERS, FIELDS_PARAMETER]),
+)
 class StreakViewSet(viewsets.ModelViewSet):
     queryset = Streak.objects.all().prefetch_related('completion_set')
     serializer_class = StreakSerializer
     permission_classes = [AllowAny]  # Keep AllowAny for backward compatibility
+    pagination_class = StreakPagination
+
+    def get_queryset(self):
+        if self.action == 'toggle':
+            return Streak.objects.select_for_update()
+        # retrieve() prefetches once it knows the client needs a body
+        if self.action in ('destroy', 'retrieve', 'aggregates') or not self.nests_completions():
+            return Streak.objects.all()
+        return Streak.objects.all().prefetch_related(self.completion_prefetch())
+
+    def completion_prefetch(self):
+        completions = self.completion_queryset()
+        if self.completion_params()['encoding'] == 'bitmap':
+            completions = completions.only('streak_id', 'date_completed')
+        return Prefetch('completion_set', queryset=completions)
+
+    def completion_queryset(self):
+        """Completions inside the requested window, in the order they are nested."""
+        since, until = self.completion_window()
+        completions = Completion.objects.filter(date_completed__gte=since)
+        if until:
+            completions = completions.filter(date_completed__lte=until)
+        return completions.order_by('streak_id', 'date_completed')
+
+    def get_serializer_class(self):
+        if self.completion_params()['encoding'] == 'bitmap':
+            return StreakBitmapSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['since'], _ = self.completion_window()
+        return context
+
+    def nests_completions(self):
+        """Whether the response includes the nested completions, in either encoding."""
+        names = requested_fields(self.request)
+        if names is None:
+            return True
+        return ('completion_bitmap' if self.completion_params()['encoding'] == 'bitmap' else 'completions') in names
+
+    def completion_params(self):
+        """Validated since/until/days/encoding query parameters."""
+        if not hasattr(self, '_completion_params'):
+            params = CompletionWindowSerializer(data=self.request.query_params)
+            params.is_valid(raise_exception=True)
+            self._completion_params = params.validated_data
+        return self._completion_params
+
+    def completion_window(self):
+        """Resolve the since/until/days query parameters into a (since, until) pair."""
+        params = self.completion_params()
+        since = params.get('since')
+        if since is None:
+            days = params.get('days', settings.COMPLETION_WINDOW_DAYS)
+            since = date.today() - timedelta(days=days - 1)
+        until = params.get('until')
+        if until is None and params['encoding'] == 'bitmap':
+            # The bitmap spans origin to the last day, so a completion far ahead would inflate it
+            until = date.today()
+        return since, until
 
     def create(self, request, *args, **kwargs):
-        print(request.data)
+        logger.debug('Creating streak', extra={'data': request.data})
         return super().create(request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._cached_dashboard(dashboard_cache.ALL_STREAKS, lambda: self._build_dashboard(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        streak = self.get_object()
+        # Tagged with the owner's dashboard version, which every change to the streak bumps
+        key = dashboard_cache.payload_key(streak.user_id, self.dashboard_variant())
+        etag = dashboard_cache.etag(key, request.accepted_renderer.format)
+        response = self.not_modified(etag)
+        if response is None:
+            if self.nests_completions():
+                prefetch_related_objects([streak], self.completion_prefetch())
+            with timed('serializer'):
+                response = Response(self.get_serializer(streak).data)
+        return self.tag(response, etag)
+
+    def _cached_dashboard(self, scope, build, variant=None):
+        """Serve the serialized streaks from the dashboard cache, calling `build` on a miss."""
+        key = dashboard_cache.payload_key(scope, variant or self.dashboard_variant())
+        etag = dashboard_cache.etag(key, self.request.accepted_renderer.format)
+        response = self.not_modified(etag)
+        if response is None:
+            data, hit = dashboard_cache.get_or_build(key, build)
+            response = Response(data)
+            response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return self.tag(response, etag)
+
+    def not_modified(self, etag):
+        """The 304 response when If-None-Match already names `etag`, else None."""
+        return get_conditional_response(self.request, etag=etag)
+
+    def tag(self, response, etag):
+        response['ETag'] = etag
+        # Per user and changing at any time, so browsers must revalidate and proxies must not share it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def dashboard_variant(self):
+        """Dashboard cache variant of this request."""
+        # The default window moves with the date, so key on the resolved bounds
+        since, until = self.completion_window()
+        # Absolute, like the next links of paginated pages
+        return f'{since}:{until}:{self.request.build_absolute_uri()}'
+
+    def _build_dashboard(self, queryset, paginate=True):
+        rows = fast_serializers.streak_values(queryset)
+        page = self.paginator.page_queryset(rows, self.request) if paginate else None
+        streaks = list(rows) if page is None else self.paginator.page_rows(list(page))
+        completions = self.completion_rows(streaks)
+        data = self.dashboard_data(streaks, None if completions is None else list(completions))
+        return data if page is None else self.paginator.get_paginated_data(data)
+
+    def completion_rows(self, streaks):
+        """Nested completion rows for the `streaks` rows, or None when the response leaves them out."""
+        if not self.nests_completions():
+            return None
+        return fast_serializers.completion_values(self.completion_queryset(), [streak['id'] for streak in streaks])
+
+    def dashboard_data(self, streaks, completions):
+        """The list or my_streaks body for plain rows, same as the serializer would return."""
+        since, _ = self.completion_window()
+        with timed('serializer'):
+            return fast_serializers.streak_data(
+                streaks, completions, self.completion_params()['encoding'], since, requested_fields(self.request)
+            )
+
     @extend_schema(
         operation_id='streaks_my_streaks_list',
         summary='List my streaks',
         description='List all streaks for the current authenticated user.',
+        parameters=[*COMPLETION_WINDOW_PARAMETERS, FIELDS_PARAMETER],
         responses={200: StreakSerializer(many=True)},
     )
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_streaks(self, request):
         """List all streaks for the current user."""
-        streaks = Streak.objects.filter(user=request.user)
-        serializer = self.get_serializer(streaks, many=True)
-        return Response(serializer.data)
+        streaks = self.get_queryset().filter(user_id=request.user.id)
+        return self._cached_dashboard(request.user.id, lambda: self._build_dashboard(streaks, paginate=False))
+
+    @extend_schema(
+        summary='Completion aggregates of a streak',
+        description=(
+            'Weekday histogram, per-month and per-week completion counts and the completion rate '
+            'since start_date, for charts that would otherwise need every completion.'
+        ),
+        responses={200: StreakAggregatesSerializer},
+    )
+    @action(detail=True, methods=['get'])
+    def aggregates(self, request, pk=None):
+        """Completion counts of one streak, grouped in the database."""
+        streak = self.get_object()
+        # Cached with the owner's dashboards, whose version every completion change bumps
+        return self._cached_dashboard(
+            streak.user_id,
+            lambda: StreakAggregatesSerializer(streak.completion_aggregates()).data,
+            variant=f'aggregates:{streak.pk}:{date.today()}',
+        )
+
+    @extend_schema(
+        summary='Toggle a completion',
+        description=(
+            'Completes or un-completes one day of the streak in a single request and returns the '
+            'updated counters. Without completed the day is flipped; with it the request is '
+            'idempotent.'
+        ),
+        parameters=[
+            OpenApiParameter('date', date, description='Day to change. Defaults to today.'),
+            OpenApiParameter(
+                'completed', bool,
+                description='true completes the day, false removes the completion, omitted flips it.',
+            ),
+        ],
+        request=None,
+        responses={200: CompletionToggleResultSerializer},
+    )
+    @action(detail=True, methods=['post'])
+    def toggle(self, request, pk=None):
+        """Complete, un-complete or flip one day, with the stats updated in the same transaction."""
+        params = CompletionToggleSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        day = params.validated_data['date']
+        with transaction.atomic():
+            # Locked, so concurrent toggles of this streak update the counters in turn
+            streak = self.get_object()
+            completed = streak.toggle_completion(day, params.validated_data['completed'])
+        with timed('serializer'):
+            data = CompletionToggleResultSerializer({'date': day, 'completed': completed, 'streak': streak}).data
+        return Response(data)
+
+    @extend_schema(
+        summary='Export my streak history',
+        description=(
+            'Streams all streaks and completions of the current user as CSV, or NDJSON with '
+            '`?format=ndjson` or `Accept: application/x-ndjson`. One record per line, the streaks '
+            'first, then the completions by streak and date.'
+        ),
+        responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR},
+    )
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+        renderer_classes=[CSVRenderer, NDJSONRenderer],
+    )
+    def export(self, request):
+        renderer = request.accepted_renderer
+        chunks = history.export(request.user, renderer.format)
+        if isinstance(request._request, ASGIRequest):
+            chunks = history.aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="streaks.{renderer.format}"'
+        return response
+
+    @extend_schema(
+        summary='Import streak history',
+        description=(
+            'Adds the streaks and completions of a file made by the export action to the current '
+            'user, read as it is uploaded. Streaks with the color of one of the user\'s streaks are '
+            'merged into it, days already completed are skipped. Any invalid line rejects the whole file.'
+        ),
+        request={'text/csv': OpenApiTypes.STR, 'application/x-ndjson': OpenApiTypes.STR},
+        responses={200: StreakImportResultSerializer},
+    )
+    @action(
+        detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+        parser_classes=[CSVParser, NDJSONParser], url_path='import', url_name='import',
+    )
+    def import_history(self, request):
+        with transaction.atomic():
+            result = history.load(request.user, request.data)
+        return Response(StreakImportResultSerializer(result).data)
+
 
+@extend_schema_view(
+    list=extend_schema(parameters=[FIELDS_PARAMETER]),
+    retrieve=extend_schema(parameters=[FIELDS_PARAMETER]),
+)
 class CompletionViewSet(viewsets.ModelViewSet):
     queryset = Completion.objects.all()
     serializer_class = CompletionSerializer
     permission_classes = [AllowAny]  # Keep AllowAny for backward compatibility
+    pagination_class = CompletionPagination
+
+    @extend_schema(
+        summary='Bulk create or delete completions',
+        description=(
+            'POST creates the given (streak, date_completed) pairs, skipping days that are '
+            'already completed. DELETE removes them. Stats are recalculated once per streak.'
+        ),
+        request=CompletionBulkSerializer,
+        responses={200: CompletionBulkResultSerializer},
+    )
+    @action(detail=False, methods=['post', 'delete'])
+    def bulk(self, request):
+        """Create or delete many completions with a single stats recalculation per streak."""
+        serializer = CompletionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pairs = {(item['streak'], item['date_completed']) for item in serializer.validated_data['completions']}
+        streak_ids = {streak_id for streak_id, _ in pairs}
+
+        with transaction.atomic():
+            with suspend_stats_updates():
+                if request.method == 'POST':
+                    result = {'created': self._bulk_create(pairs, streak_ids)}
+                else:
+                    result = {'deleted': self._bulk_delete(pairs)}
+
+            streaks = list(Streak.objects.filter(id__in=streak_ids).order_by('id'))
+            for streak in streaks:
+                streak.recalculate_stats()
+
+        with timed('serializer'):
+            result['streaks'] = StreakStatsSerializer(streaks, many=True).data
+        return Response(result)
+
+    def _bulk_create(self, pairs, streak_ids):
+        existing = set(
+            Completion.objects.filter(
+                streak_id__in=streak_ids,
+                date_completed__in={day for _, day in pairs},
+            ).values_list('streak_id', 'date_completed')
+        )
+        # bulk_create skips Completion.save(), so fill in day_of_week here
+        new_completions = [
+            Completion(streak_id=streak_id, date_completed=day, day_of_week=day.weekday())
+            for streak_id, day in sorted(pairs - existing)
+        ]
+        Completion.objects.bulk_create(new_completions, batch_size=1000, ignore_conflicts=True)
+        return len(new_completions)
+
+    def _bulk_delete(self, pairs):
+        days_by_streak = {}
+        for streak_id, day in pairs:
+            days_by_streak.setdefault(streak_id, set()).add(day)
+        query = Q()
+        for streak_id, days in days_by_streak.items():
+            query |= Q(streak_id=streak_id, date_completed__in=days)
+        deleted, _ = Completion.objects.filter(query).delete()
+        return deleted
+
+
+LIMIT_PARAMETER = OpenApiParameter('limit', int, description='Number of entries, 1 to 100. Defaults to 10.')
+
+
+class LeaderboardViewSet(viewsets.ViewSet):
+    """Rankings and counts across all users, see leaderboard.py."""
+    permission_classes = [IsAuthenticated]
+
+    def limit(self):
+        params = LeaderboardParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data['limit']
+
+    @extend_schema(
+        summary='Longest current streaks',
+        description='Active streaks of all users ranked by current_streak, up to date with every completion.',
+        parameters=[LIMIT_PARAMETER],
+        responses={200: LeaderboardStreakSerializer(many=True)},
+    )
+    @action(detail=False, methods=['get'])
+    def streaks(self, request):
+        rows = leaderboard.top_streaks(self.limit())
+        with timed('serializer'):
+            data = LeaderboardStreakSerializer(rows, many=True).data
+        return Response(data)
+
+    @extend_schema(
+        summary='Most active users this week',
+        description='Users ranked by completions dated this week, as of the last leaderboard refresh.',
+        parameters=[LIMIT_PARAMETER],
+        responses={200: WeeklyLeaderboardSerializer},
+    )
+    @action(detail=False, methods=['get'])
+    def active(self, request):
+        rows = leaderboard.most_active(self.limit())
+        with timed('serializer'):
+            data = WeeklyLeaderboardSerializer({'week': leaderboard.week_start(), 'results': rows}).data
+        return Response(data)
+
+    @extend_schema(
+        summary='Site totals',
+        description='Completion, streak and user counts as of refreshed_at.',
+        responses={200: LeaderboardTotalsSerializer},
+    )
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        return Response(LeaderboardTotalsSerializer(leaderboard.totals()).data)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -61,46 +447,15 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='google/initiate')
     def google_initiate(self, request):
         """Initiate Google OAuth flow."""
-        # Get OAuth credentials from environment
-        client_id = os.getenv('GOOGLE_CLIENT_ID')
-        client_secret = os.getenv('GOOGLE_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
+        template = google_oauth.flow_template(request)
+        if template is None:
             return Response(
                 {'error': 'Google OAuth credentials not configured'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-        # Determine redirect URI based on request
-        if request.is_secure() or request.META.get('HTTP_X_FORWARDED_PROTO') == 'https':
-            scheme = 'https'
-        else:
-            scheme = 'http'
-        
-        host = request.get_host()
-        redirect_uri = f"{scheme}://{host}/api/users/google/callback/"
-        
-        # Create OAuth flow
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": client_id,
-                    "client_secret": client_secret,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [redirect_uri]
-                }
-            },
-            scopes=['openid', 'https://www.googleapis.com/auth/userinfo.email', 'https://www.googleapis.com/auth/userinfo.profile']
-        )
-        flow.redirect_uri = redirect_uri
-        
         # Generate authorization URL
-        authorization_url, state = flow.authorization_url(
-            access_type='offline',
-            include_granted_scopes='true',
-            prompt='consent'
-        )
+        authorization_url, state = template.authorization_url()
         
         # Store state in session for verification
         request.session['oauth_state'] = state
@@ -113,11 +468,8 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='google/callback')
     def google_callback(self, request):
         """Handle Google OAuth callback."""
-        # Get OAuth credentials from environment
-        client_id = os.getenv('GOOGLE_CLIENT_ID')
-        client_secret = os.getenv('GOOGLE_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
+        template = google_oauth.flow_template(request)
+        if template is None:
             return Response(
                 {'error': 'Google OAuth credentials not configured'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -133,48 +485,26 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Determine redirect URI
-        if request.is_secure() or request.META.get('HTTP_X_FORWARDED_PROTO') == 'https':
-            scheme = 'https'
-        else:
-            scheme = 'http'
-        
-        host = request.get_host()
-        redirect_uri = f"{scheme}://{host}/api/users/google/callback/"
-        
-        # Create OAuth flow
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": client_id,
-                    "client_secret": client_secret,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [redirect_uri]
-                }
-            },
-            scopes=['openid', 'https://www.googleapis.com/auth/userinfo.email', 'https://www.googleapis.com/auth/userinfo.profile'],
-            state=state
-        )
-        flow.redirect_uri = redirect_uri
+        flow = template.flow(state)
         
         # Exchange authorization code for tokens
         authorization_response = request.build_absolute_uri()
         try:
-            flow.fetch_token(authorization_response=authorization_response)
+            credentials = google_oauth.fetch_token(flow, authorization_response)
         except Exception as e:
             return Response(
                 {'error': f'Failed to fetch token: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        credentials = flow.credentials
-        
-        # Get user info from Google
-        from googleapiclient.discovery import build
-        
-        user_info_service = build('oauth2', 'v2', credentials=credentials)
-        user_info = user_info_service.userinfo().get().execute()
+        # Get user info from the ID token, or from Google if there was none
+        try:
+            user_info = google_oauth.user_info(credentials, settings.GOOGLE_CLIENT_ID)
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid ID token: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         google_id = user_info.get('id')
         google_email = user_info.get('email')
@@ -198,19 +528,11 @@ class UserViewSet(viewsets.ModelViewSet):
             user = User.objects.get(google_id=google_id)
             created = False
         except User.DoesNotExist:
-            # User doesn't exist, create a new one
-            # Generate a unique username
+            # User doesn't exist, create a new one with a unique username
             base_username = google_email.split('@')[0] if google_email else f'google_{google_id}'
-            username = base_username
-            counter = 1
-            # Ensure username is unique
-            while User.objects.filter(username=username).exists():
-                username = f'{base_username}_{counter}'
-                counter += 1
-            
-            user = User.objects.create(
+            user = create_user_with_free_username(
+                base_username,
                 google_id=google_id,
-                username=username,
                 email=google_email,
                 google_email=google_email,
                 google_picture=google_picture,
@@ -247,12 +569,19 @@ class UserViewSet(viewsets.ModelViewSet):
         # Redirect to frontend callback route
         # Determine frontend URL
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost')
+        if settings.API_TOKEN_AUTH:
+            # In the fragment, so it never reaches a server log
+            return redirect(f'{frontend_url}/callback#token={issue_token(user)}')
         return redirect(f'{frontend_url}/callback')
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         """Get current authenticated user."""
-        serializer = self.get_serializer(request.user)
+        user = request.user
+        if not isinstance(user, User):
+            # A bearer token only carries the id
+            user = get_object_or_404(User, pk=user.id)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
@@ -260,4 +589,20 @@ class UserViewSet(viewsets.ModelViewSet):
         """Logout current user."""
         from django.contrib.auth import logout
         logout(request)
-        return Response({'message': 'Successfully logged out'})
\ No newline at end of file
+        return Response({'message': 'Successfully logged out'})
+
+
+@extend_schema(
+    summary='Request metrics',
+    description=(
+        'Request durations, query counts and section timings of the worker process that answers, '
+        'in the Prometheus text format. Staff only; scrapers can use basic auth.'
+    ),
+    responses={(200, 'text/plain'): OpenApiTypes.STR},
+)
+@api_view(['GET'])
+@authentication_classes([BasicAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+@permission_classes([IsAdminUser])
+@renderer_classes([PrometheusRenderer])
+def metrics(request):
+    return Response(request_metrics.requests.render())